@@ -0,0 +1,117 @@
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from graphology.etl.transform._citations import (
+    CITATION_AUTHORS_FILE,
+    CITATION_YEARS_FILE,
+    CITATIONS_FILE,
+    PUBLICATIONS_FILE,
+)
+
+
+class CitationMatrix(NamedTuple):
+    author_ids: pd.Index
+    years: np.ndarray
+    # Cumulative citations, a row per author and a column per year
+    citations: np.ndarray
+    # Whether the author has any cited document in each year
+    published: np.ndarray
+
+
+def load_citation_matrix(merged_directory: Path, mmap: bool = True) -> CitationMatrix:
+    """
+    Load the citation matrix built along with the merged data when the
+    transformer is created with `citation_matrix`. With `mmap`, the matrices
+    are only read as they are sliced
+    """
+    mmap_mode = "r" if mmap else None
+    df_authors = pd.read_csv(
+        merged_directory / CITATION_AUTHORS_FILE, sep="\t", dtype=str
+    )
+    df_years = pd.read_csv(merged_directory / CITATION_YEARS_FILE, sep="\t")
+    return CitationMatrix(
+        pd.Index(df_authors["author_id"]),
+        df_years["year"].to_numpy(),
+        np.load(merged_directory / CITATIONS_FILE, mmap_mode=mmap_mode),
+        np.load(merged_directory / PUBLICATIONS_FILE, mmap_mode=mmap_mode),
+    )
+
+
+def _frame(
+    matrix: CitationMatrix, rows: np.ndarray, low: int, high: int, year: int = 0
+) -> pd.DataFrame:
+    # Only years with publications are kept, like the rows of the notebook's
+    # query
+    citations = np.asarray(matrix.citations[rows, low:high])
+    row, column = np.nonzero(np.asarray(matrix.published[rows, low:high]))
+    return pd.DataFrame(
+        {
+            "author_id": matrix.author_ids[rows[row]],
+            "year": matrix.years[low:high][column] - year,
+            "cumulative_citations": citations[row, column],
+        }
+    )
+
+
+def yearly_impact(matrix: CitationMatrix) -> pd.DataFrame:
+    """
+    Cumulative citations of every author in every year they published, the
+    same rows as the notebook's `get_yearly_impact_per_author`
+    """
+    return _frame(matrix, np.arange(len(matrix.author_ids)), 0, len(matrix.years))
+
+
+def _rows(matrix: CitationMatrix, author_ids) -> np.ndarray:
+    rows = matrix.author_ids.get_indexer(pd.Index(author_ids).unique())
+    return np.sort(rows[rows >= 0])
+
+
+def _columns(matrix: CitationMatrix, year: int, window: int) -> tuple[int, int]:
+    first_year = int(matrix.years[0]) if len(matrix.years) else year
+    low = int(np.clip(year - window - first_year, 0, len(matrix.years)))
+    high = int(np.clip(year + window + 1 - first_year, 0, len(matrix.years)))
+    return low, high
+
+
+def shift_reference_year(
+    matrix: CitationMatrix, author_ids, year: int, window: int
+) -> pd.DataFrame:
+    """
+    Cumulative citations of `author_ids` in the `window` years around `year`,
+    with years relative to it. Years with no citations yet are left out, as
+    in the notebook's `shift_reference_year`
+    """
+    rows = _rows(matrix, author_ids)
+    low, high = _columns(matrix, year, window)
+    df = _frame(matrix, rows, low, high, year)
+    return df[df["cumulative_citations"] != 0].reset_index(drop=True)
+
+
+def normalize_citations(
+    matrix: CitationMatrix, author_ids, year: int, window: int
+) -> pd.DataFrame:
+    """
+    `shift_reference_year` with the citations divided by those of the
+    reference year, as in the notebook's `normalize_citations`. Authors
+    without a row on the reference year have no baseline
+    """
+    rows = _rows(matrix, author_ids)
+    df = shift_reference_year(matrix, author_ids, year, window)
+
+    baseline = np.full(len(rows), np.nan)
+    column = year - int(matrix.years[0]) if len(matrix.years) else -1
+    if 0 <= column < len(matrix.years):
+        citations = np.asarray(matrix.citations[rows, column], dtype=float)
+        published = np.asarray(matrix.published[rows, column])
+        baseline = np.where(published & (citations != 0), citations, np.nan)
+
+    df["baseline_citations"] = (
+        pd.Series(baseline, index=matrix.author_ids[rows])
+        .reindex(df["author_id"])
+        .to_numpy()
+    )
+    df["normalized_citations"] = df["cumulative_citations"] / df["baseline_citations"]
+    return df
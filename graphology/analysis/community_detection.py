@@ -1,135 +1,497 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from graphology.analysis.native import partition_drift
+from graphology.analysis.planner import plan
+from graphology.analysis.projection import GRAPH_PREFIX, ProjectionManager
 from graphology.etl.load.gdbms.database import driver
 from graphology import log
 import logging
 
+ALGORITHMS = ["labelPropagation", "louvain", "leiden"]
+
+# - all: the partition of every run is kept in the projected graph
+# - best: only the best partition so far is kept, along with those of the runs
+#   in progress, so memory does not grow with the number of runs
+RETAIN_MODES = ["all", "best"]
+
+# Every query returns the modularity of the partition it mutated. Label
+# propagation does not compute it, so it is computed in the same query
+MUTATE_QUERIES = {
+    "labelPropagation": """
+        CALL gds.labelPropagation.mutate($graph, $config)
+        YIELD nodePropertiesWritten
+        CALL gds.modularity.stream($graph, {
+          communityProperty: $label,
+          relationshipWeightProperty: 'count'
+        })
+        YIELD modularity
+        RETURN sum(modularity) AS totalModularity
+        """,
+    "louvain": """
+        CALL gds.louvain.mutate($graph, $config)
+        YIELD modularity AS totalModularity
+        RETURN totalModularity
+        """,
+    "leiden": """
+        CALL gds.leiden.mutate($graph, $config)
+        YIELD modularity AS totalModularity
+        RETURN totalModularity
+        """,
+}
+
+
+# Authors with documents since a given year, the frontier of an incremental
+# update along with their collaborators
+RECENT_AUTHORS_QUERY = """
+MATCH (d:Document)<-[:INVOLVES_DOCUMENT]-(:Authorship)-[:INVOLVES_AUTHOR]->(a:FrequentCollaborator)
+WHERE d.date >= $since
+RETURN DISTINCT a.scopus_id AS scopus_id
+"""
+
+COLLABORATORS_QUERY = """
+UNWIND $authors AS author_id
+MATCH (:Author {scopus_id: author_id})-[:COLLABORATED_WITH_FREQUENTLY]-(b:Author)
+RETURN DISTINCT b.scopus_id AS scopus_id
+"""
+
+# Authors without a community yet are seeded with labels of their own, above
+# every existing one
+FRONTIER_PROJECTION_QUERY = """
+UNWIND $frontier AS author_id
+MATCH (a1:Author {scopus_id: author_id})-[r:COLLABORATED_WITH_FREQUENTLY]->(a2:Author)
+WHERE a2.scopus_id IN $frontier
+WITH a1, a2, r
+WITH gds.graph.project(
+  $graph,
+  a1,
+  a2,
+  {
+    sourceNodeProperties: a1 { community: coalesce(a1.community, $offset + id(a1)) },
+    targetNodeProperties: a2 { community: coalesce(a2.community, $offset + id(a2)) },
+    relationshipProperties: r { .count }
+  },
+  {
+      undirectedRelationshipTypes: ['*']
+  }
+) AS g
+RETURN g.nodeCount AS nodeCount, g.relationshipCount AS relationshipCount
+"""
+
 
 def _community_label(algorithm_name: str, iteration: int) -> str:
     return f"community_{algorithm_name}_{iteration}"
 
 
-def analyze():
+def available_cores() -> int:
+    """
+    Number of processors available to the database, or to this machine if GDS
+    does not report it
+    """
     with driver.session() as session:
-        # 1. Delete projection if it already exists
-        session.run(
+        record = session.run(
             """
-            WITH 'authorGraph' AS graphName
-            CALL gds.graph.exists(graphName) YIELD exists
-            WITH graphName, exists
-            WHERE exists
-            CALL gds.graph.drop(graphName) YIELD graphName AS _
-            RETURN null
+            CALL gds.debug.sysInfo() YIELD key, value
+            WHERE key = 'availableProcessors'
+            RETURN value
             """
-        )
+        ).single()
+
+    if record is None:
+        return os.cpu_count() or 1
+    return int(record["value"])
+
 
-        # 2. Create projection if it doesn't exist
+def _partition_labels(graph: str) -> list[str]:
+    # Partitions left in the projection by this or earlier analyses
+    with driver.session() as session:
+        record = session.run(
+            """
+            CALL gds.graph.list($graph) YIELD schema
+            UNWIND keys(schema.nodes) AS nodeLabel
+            UNWIND keys(schema.nodes[nodeLabel]) AS property
+            WITH DISTINCT property
+            WHERE property STARTS WITH 'community_'
+            RETURN collect(property) AS labels
+            """,
+            graph=graph,
+        ).single()
+    return record["labels"] if record else []  # type: ignore
+
+
+def _drop_partitions(graph: str, labels: list[str]) -> None:
+    if not labels:
+        return
+    with driver.session() as session:
         session.run(
             """
-            MATCH (a1:Author)-[r:COLLABORATED_WITH]->(a2:Author)
-            WHERE r.count >= 2
-            WITH a1, a2, r
-            RETURN gds.graph.project(
-              'authorGraph',
-              a1,
-              a2,
-              {
-                relationshipProperties: r { .count }
-              },
-              {
-                  undirectedRelationshipTypes: ['*']
-              }
-            )
+            CALL gds.graph.nodeProperties.drop($graph, $labels)
+            YIELD propertiesRemoved
+            RETURN propertiesRemoved
+            """,
+            graph=graph,
+            labels=labels,
+        ).consume()
+
+
+def run_single(
+    graph: str,
+    algorithm: str,
+    seed: int,
+    concurrency: int = 1,
+    max_iterations: int | None = None,
+    seed_property: str | None = None,
+) -> dict:
+    """
+    Run one community detection algorithm over a projected graph, storing
+    its partition in the `community_<algorithm>_<seed>` property.
+
+    Only Leiden takes a random seed. The other algorithms are only
+    reproducible with `concurrency=1`, which is also needed for Leiden to
+    reproduce a run exactly
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm {algorithm!r}")
+
+    label = _community_label(algorithm, seed)
+    config = {
+        "mutateProperty": label,
+        "relationshipWeightProperty": "count",
+        "concurrency": concurrency,
+    }
+    if algorithm == "leiden":
+        config["randomSeed"] = seed
+        if max_iterations is not None:
+            config["maxLevels"] = max_iterations
+    elif max_iterations is not None:
+        config["maxIterations"] = max_iterations
+    if seed_property is not None:
+        config["seedProperty"] = seed_property
+
+    start = time.perf_counter()
+    with driver.session() as session:
+        result = session.run(
+            MUTATE_QUERIES[algorithm], graph=graph, config=config, label=label
+        )
+        modularity = result.single()["totalModularity"]  # type:ignore
+
+    return {
+        "algorithm": algorithm,
+        "seed": seed,
+        "label": label,
+        "concurrency": concurrency,
+        "seconds": time.perf_counter() - start,
+        "modularity": modularity,
+    }
+
+
+def _has_communities() -> bool:
+    with driver.session() as session:
+        record = session.run(
+            """
+            CALL db.propertyKeys() YIELD propertyKey
+            WHERE propertyKey = 'community'
+            RETURN count(*) AS found
             """
+        ).single()
+    return record["found"] > 0  # type: ignore
+
+
+def _previous_labels(previous: pd.Series) -> np.ndarray:
+    # Nodes without a previous community are each counted as one of their own
+    previous = pd.to_numeric(previous, errors="coerce")
+    missing = (previous.isna() | (previous < 0)).to_numpy()
+    labels = previous.fillna(-1).to_numpy(dtype=np.int64)
+    labels[missing] = labels.max(initial=0) + 1 + np.arange(missing.sum())
+    return labels
+
+
+def _drift(graph: str, label: str) -> dict:
+    """
+    Drift of the partition in `label` from the `community` the graph was
+    seeded with
+    """
+    with driver.session() as session:
+        result = session.run(
+            """
+            CALL gds.graph.nodeProperties.stream($graph, ['community', $label])
+            YIELD nodeId, nodeProperty, propertyValue
+            RETURN nodeId, nodeProperty, propertyValue
+            """,
+            graph=graph,
+            label=label,
         )
+        df = pd.DataFrame([record.data() for record in result])
+
+    df = df.pivot(index="nodeId", columns="nodeProperty", values="propertyValue")
+    return partition_drift(
+        _previous_labels(df["community"]), df[label].to_numpy(dtype=np.int64)
+    )
 
-        algorithms = {
-            "labelPropagation": {
-                "query": """
-                    CALL gds.labelPropagation.mutate(
-                        'authorGraph',
-                        {
-                            mutateProperty: $label,
-                            relationshipWeightProperty: 'count'
-                        }
-                    )
-                    """,
-                "modularity_in_stats": False,
-            },
-            "louvain": {
-                "query": """
-                    CALL gds.louvain.mutate(
-                        'authorGraph',
-                        {
-                            mutateProperty: $label,
-                            relationshipWeightProperty: 'count'
-                        }
-                    ) YIELD modularity as totalModularity
-                    """,
-                "modularity_in_stats": True,
-            },
-            "leiden": {
-                "query": """
-                    CALL gds.leiden.mutate(
-                        'authorGraph',
-                        {
-                            mutateProperty: $label,
-                            relationshipWeightProperty: 'count'
-                        }
-                    ) YIELD modularity as totalModularity
-                    """,
-                "modularity_in_stats": True,
-            },
+
+def refresh_frontier(
+    since_year: int,
+    concurrency: int | None = None,
+    max_iterations: int | None = None,
+    batch_size: int = 10_000,
+) -> dict:
+    """
+    Update the communities of the authors with documents since `since_year`
+    with label propagation, seeded with the current communities, over the
+    subgraph of those authors and their collaborators. Communities of the
+    collaborators are only read, so the rest of the partition is untouched
+    """
+    start = time.perf_counter()
+    graph = f"{GRAPH_PREFIX}_frontier_{since_year}"
+
+    with driver.session() as session:
+        recent = [
+            record["scopus_id"]
+            for record in session.run(RECENT_AUTHORS_QUERY, since=str(since_year))
+        ]
+        collaborators = [
+            record["scopus_id"]
+            for record in session.run(COLLABORATORS_QUERY, authors=recent)
+        ]
+        frontier = sorted(set(recent) | set(collaborators))
+
+        record = session.run(
+            "MATCH (a:Author) RETURN coalesce(max(a.community), -1) + 1 AS offset"
+        ).single()
+        offset = record["offset"]  # type: ignore
+
+        session.run(
+            "CALL gds.graph.drop($graph, false) YIELD graphName RETURN graphName",
+            graph=graph,
+        ).consume()
+        session.run(
+            FRONTIER_PROJECTION_QUERY, graph=graph, frontier=frontier, offset=offset
+        ).consume()
+
+        config = {
+            "seedProperty": "community",
+            "relationshipWeightProperty": "count",
+            "concurrency": concurrency or available_cores(),
         }
+        if max_iterations is not None:
+            config["maxIterations"] = max_iterations
+        result = session.run(
+            """
+            CALL gds.labelPropagation.stream($graph, $config)
+            YIELD nodeId, communityId
+            WITH gds.util.asNode(nodeId) AS a, communityId
+            RETURN a.scopus_id AS scopus_id,
+                   a.community AS previous,
+                   communityId AS community
+            """,
+            graph=graph,
+            config=config,
+        )
+        df = pd.DataFrame([record.data() for record in result])
 
-        # 3. Run community detection algorithms
-        label_to_modularity: dict[str, float] = {}
-        for name, props in algorithms.items():
+        session.run(
+            "CALL gds.graph.drop($graph, false) YIELD graphName RETURN graphName",
+            graph=graph,
+        ).consume()
 
-            # Repeat stochastic algorithms
-            TIMES: int = 10
-            for i in range(1, TIMES + 1):
-                label = _community_label(name, i)
+        # Only the recent authors are updated, the collaborators around them
+        # only lend their communities
+        if len(df):
+            df = df[df["scopus_id"].isin(set(recent))]
+        rows = (
+            df[["scopus_id", "community"]].to_dict(orient="records") if len(df) else []
+        )
+        for i in range(0, len(rows), batch_size):
+            session.run(
+                """
+                UNWIND $rows AS row
+                MATCH (a:Author {scopus_id: row.scopus_id})
+                SET a.community = row.community
+                """,
+                rows=rows[i : i + batch_size],
+            ).consume()
+
+    drift = (
+        partition_drift(
+            _previous_labels(df["previous"]), df["community"].to_numpy(dtype=np.int64)
+        )
+        if len(df)
+        else partition_drift(np.array([]), np.array([]))
+    )
+    report = {
+        "authors": len(rows),
+        "frontier": len(frontier),
+        "seconds": time.perf_counter() - start,
+        **drift,
+    }
+    log(
+        f"refreshed the communities of {report['authors']} authors "
+        f"(frontier of {report['frontier']}) in {report['seconds']:.1f}s, "
+        f"nmi {report['nmi']:.4f}, changed {report['changed_fraction']:.2%}"
+    )
+    return report
 
-                result = session.run(
-                    props["query"],
-                    label=label,
-                )
 
-                if not props["modularity_in_stats"]:
-                    # 4. Compute modularity
-                    result = session.run(
-                        """
-                        CALL gds.modularity.stream('authorGraph', {
-                          communityProperty: $label,
-                          relationshipWeightProperty: 'count'
-                        })
-                        YIELD modularity
-                        RETURN sum(modularity) as totalModularity
-                        """,
-                        label=label,
-                    )
-
-                modularity = result.single()["totalModularity"]  # type:ignore
-                label_to_modularity[label] = modularity
+def analyze(
+    dataset: str | None = None,
+    times: int = 10,
+    workers: int = 3,
+    max_iterations: int | None = None,
+    reproducible: bool = False,
+    retain: str = "all",
+    incremental: bool = False,
+    check_memory: bool = True,
+) -> pd.DataFrame:
+    """
+    Run every algorithm `times` times, `workers` runs at a time, and write the
+    partition with the best modularity as the `community` property.
+
+    Runs share the available cores. With `reproducible`, every run uses one
+    core so that it can be repeated exactly with `run_single`; algorithms
+    without a random seed then give the same partition every time, so they
+    are only run once.
+
+    With `incremental`, Louvain and Leiden start from the communities written
+    by an earlier run, and the drift from them is reported. Label propagation
+    is left out, because `refresh_frontier` updates it locally instead.
+
+    With `check_memory`, the projection and the runs are estimated first, and
+    fewer runs are started at a time, or fewer partitions retained, if they
+    would not fit the heap
+    """
+    if retain not in RETAIN_MODES:
+        raise ValueError(
+            f"Unknown retain mode {retain!r}, expected one of {RETAIN_MODES}"
+        )
 
+    if incremental and not _has_communities():
+        raise Exception(
+            "Unable to run incrementally, because no communities have been "
+            "written yet. Run the analysis from scratch first."
+        )
+    seed_property = "community" if incremental else None
+
+    projection = ProjectionManager(dataset, seed_property=seed_property)
+    runs = [
+        (algorithm, seed)
+        for algorithm in ALGORITHMS
+        for seed in range(1, times + 1)
+        if not (reproducible and algorithm != "leiden" and seed > 1)
+        if not (incremental and algorithm == "labelPropagation")
+    ]
+
+    # 1. Check that the projection and the runs fit the heap before starting
+    cores = available_cores()
+    if check_memory:
+        memory_plan = plan(
+            projection,
+            sorted({algorithm for algorithm, _ in runs}),
+            len(runs),
+            workers,
+            cores,
+            reproducible=reproducible,
+            retain=retain,
+            max_iterations=max_iterations,
+        )
+        workers, concurrency, retain = (
+            memory_plan.workers,
+            memory_plan.concurrency,
+            memory_plan.retain,
+        )
+    else:
+        concurrency = 1 if reproducible else max(1, cores // workers)
+
+    # 2. Project the graph, or reuse the projection of the same data, without
+    # the partitions of earlier analyses, which could not be mutated again
+    graph = projection.project()
+    _drop_partitions(graph, _partition_labels(graph))
+    log(f"running {workers} runs at a time, with concurrency {concurrency} each")
+
+    # 3. Run community detection algorithms
+    results = []
+    best_run = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                run_single,
+                graph,
+                algorithm,
+                seed,
+                concurrency,
+                max_iterations,
+                seed_property,
+            ): (algorithm, seed)
+            for algorithm, seed in runs
+        }
+        for future in as_completed(futures):
+            algorithm, seed = futures[future]
+            try:
+                run = future.result()
+            except Exception as e:
                 log(
-                    f"{name} modularity (iteration {i}): {modularity}",
+                    f"{algorithm} (seed {seed}) failed: {e}",
+                    level=logging.ERROR,
                 )
+                continue
+
+            results.append(run)
+            log(
+                f"{algorithm} modularity (seed {seed}): {run['modularity']} "
+                f"in {run['seconds']:.1f}s",
+            )
+
+            if retain == "best":
+                # Runs complete one at a time here, so the best run cannot
+                # change while the losing partition is dropped
+                if best_run is None or run["modularity"] > best_run["modularity"]:
+                    best_run, run = run, best_run
+                if run is not None:
+                    _drop_partitions(graph, [run["label"]])
+
+    if not results:
+        raise Exception("Unable to run any community detection algorithm")
 
-        best = max(label_to_modularity, key=label_to_modularity.get)  # type:ignore
+    df_runs = pd.DataFrame(results).sort_values(["algorithm", "seed"])
+    if best_run is not None:
+        best = best_run["label"]
+    else:
+        best = df_runs.loc[df_runs["modularity"].idxmax(), "label"]
 
-        log(f"best was {best} with modularity {label_to_modularity[best]}")
+    log(
+        f"best was {best} with modularity "
+        f"{df_runs.loc[df_runs['label'] == best, 'modularity'].iloc[0]}"
+    )
+
+    if incremental:
+        drift = _drift(graph, best)
+        df_runs.attrs["drift"] = drift
+        log(
+            f"drift from the previous communities: nmi {drift['nmi']:.4f}, "
+            f"changed {drift['changed_fraction']:.2%}"
+        )
 
+    with driver.session() as session:
         session.run(
             f"""
-            CALL gds.graph.nodeProperties.write('authorGraph', [
+            CALL gds.graph.nodeProperties.write($graph, [
                 {{
                     {best}: "community"
                 }}
             ])
             YIELD nodeProperties
             """,  # type:ignore
-        )
+            graph=graph,
+        ).consume()
+
+    # A reused projection must not keep the partitions of this analysis
+    _drop_partitions(graph, _partition_labels(graph))
+
+    return df_runs.reset_index(drop=True)
 
 
 if __name__ == "__main__":
-    analyze()
+    print(analyze())
@@ -0,0 +1,188 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from graphology.etl.load.gdbms.database import driver
+from graphology import log
+
+UNICAMP_AFFILIATION_ID = "60029570"
+
+# Reference years of the study
+FIRST_YEAR = 2005
+LAST_YEAR = 2020
+
+PUBLICATIONS_QUERY = """
+MATCH (a:Author)<-[:INVOLVES_AUTHOR]-(:Authorship)-[:INVOLVES_DOCUMENT]->(d:Document)
+WHERE d.date IS NOT NULL
+RETURN a.scopus_id AS author_id,
+       min(d.date) AS first_publication,
+       max(d.date) AS last_publication
+"""
+
+# An external collaboration is a document where the author has an internal
+# authorship and someone else an external one
+FIRST_EXTERNAL_COLLABORATION_QUERY = """
+MATCH (a1:Author)<-[:INVOLVES_AUTHOR]-(auth1:Authorship)-[:INVOLVES_DOCUMENT]->(d:Document),
+      (d)<-[:INVOLVES_DOCUMENT]-(auth2:Authorship)-[:INVOLVES_AUTHOR]->(a2:Author)
+WHERE a1 <> a2 AND
+      auth1.external = false AND
+      auth2.external = true AND
+      d.date IS NOT NULL
+RETURN a1.scopus_id AS author_id,
+       min(d.date) AS first_external_collaboration
+"""
+
+# Authors from the institution, both by home institution and by community
+INSTITUTION_AUTHORS_QUERY = """
+MATCH (a:Author)-[:HOME_INSTITUTION]->(i:Institution)
+WHERE a.community_institution = $institution AND
+      i.scopus_id = $institution
+RETURN DISTINCT a.scopus_id AS author_id
+"""
+
+
+def build_timeline(institution: str = UNICAMP_AFFILIATION_ID) -> pd.DataFrame:
+    """
+    Date of the first and last publication, date of the first external
+    collaboration and whether they are from `institution`, for every author,
+    indexed by author ID
+    """
+    start = time.perf_counter()
+    with driver.session() as session:
+        df_publications = pd.DataFrame(
+            [record.data() for record in session.run(PUBLICATIONS_QUERY)],
+            columns=["author_id", "first_publication", "last_publication"],
+        )
+        df_external = pd.DataFrame(
+            [
+                record.data()
+                for record in session.run(FIRST_EXTERNAL_COLLABORATION_QUERY)
+            ],
+            columns=["author_id", "first_external_collaboration"],
+        )
+        institution_authors = [
+            record["author_id"]
+            for record in session.run(
+                INSTITUTION_AUTHORS_QUERY, institution=institution
+            )
+        ]
+
+    timeline = (
+        df_publications.merge(df_external, on="author_id", how="outer")
+        .merge(
+            pd.DataFrame({"author_id": institution_authors}),
+            on="author_id",
+            how="outer",
+        )
+        .set_index("author_id")
+        .sort_index()
+    )
+    timeline["from_institution"] = timeline.index.isin(institution_authors)
+    log(
+        f"built the timeline of {len(timeline)} authors "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return timeline
+
+
+def _dates(timeline: pd.DataFrame, column: str, missing: str) -> pd.Series:
+    return timeline[column].fillna(missing).astype(str)
+
+
+def control_group(timeline: pd.DataFrame, year: int) -> pd.DataFrame:
+    """
+    Authors from the institution with no external collaborations before
+    `year + 1`, with at least one publication before `year` and one after it.
+
+    As in the notebook's query, the publication "on year" has to be from
+    `year + 1` on
+    """
+    start, end = f"{year}-01-01", f"{year + 1}-01-01"
+    mask = (
+        timeline["from_institution"].to_numpy(dtype=bool)
+        & ~(_dates(timeline, "first_external_collaboration", "9999") < end)
+        & (_dates(timeline, "first_publication", "9999") < start)
+        & (_dates(timeline, "last_publication", "") >= end)
+    )
+    return pd.DataFrame({"author_id": timeline.index[mask]})
+
+
+def experimental_group(timeline: pd.DataFrame, year: int) -> pd.DataFrame:
+    """
+    Authors with their first external collaboration on `year`, and at least
+    one publication before it
+    """
+    start, end = f"{year}-01-01", f"{year + 1}-01-01"
+    first_external = _dates(timeline, "first_external_collaboration", "")
+    mask = (
+        (first_external >= start)
+        & (first_external < end)
+        & (_dates(timeline, "first_publication", "9999") < start)
+    )
+    return pd.DataFrame({"author_id": timeline.index[mask.to_numpy()]})
+
+
+def _years(timeline: pd.DataFrame, column: str) -> np.ndarray:
+    return pd.to_numeric(timeline[column].str[:4], errors="coerce").to_numpy(
+        dtype=float
+    )
+
+
+def cohorts(
+    timeline: pd.DataFrame,
+    first_year: int = FIRST_YEAR,
+    last_year: int = LAST_YEAR,
+) -> pd.DataFrame:
+    """
+    Control and experimental groups of every reference year between
+    `first_year` and `last_year`, as `year`, `group` and `author_id` rows.
+
+    Dates are compared by year, so each author's reference years are a range
+    that can be derived from the timeline at once: the groups are the same as
+    the ones of `control_group` and `experimental_group`
+    """
+    first = _years(timeline, "first_publication")
+    last = _years(timeline, "last_publication")
+    external = _years(timeline, "first_external_collaboration")
+
+    # Experimental: the year of the first external collaboration, after the
+    # first publication
+    mask = (first < external) & (external >= first_year) & (external <= last_year)
+    df_experimental = pd.DataFrame(
+        {
+            "year": external[mask].astype(np.int64),
+            "group": "experimental",
+            "author_id": timeline.index[mask],
+        }
+    )
+
+    # Control: every year after the first publication, before the last one
+    # and before the first external collaboration, if any
+    low = np.maximum(first + 1, first_year)
+    high = np.minimum(np.fmin(external, last), last_year + 1) - 1
+    counts = np.where(
+        timeline["from_institution"].to_numpy(dtype=bool) & (high >= low),
+        high - low + 1,
+        0,
+    )
+    counts = np.nan_to_num(counts).astype(np.int64)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    df_control = pd.DataFrame(
+        {
+            "year": np.repeat(np.nan_to_num(low).astype(np.int64), counts) + offsets,
+            "group": "control",
+            "author_id": np.repeat(timeline.index.to_numpy(), counts),
+        }
+    )
+
+    return (
+        pd.concat([df_control, df_experimental], ignore_index=True)
+        .sort_values(["year", "group", "author_id"])
+        .reset_index(drop=True)
+    )
+
+
+if __name__ == "__main__":
+    df_cohorts = cohorts(build_timeline())
+    print(df_cohorts.groupby(["year", "group"]).size().unstack())
@@ -0,0 +1,585 @@
+import sys
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from graphology.etl._constants import FREQUENT_COLLABORATION_THRESHOLD
+from graphology.etl._helpers import read_neo4j_import
+from graphology import log
+
+ALGORITHMS = ["labelPropagation", "louvain", "leiden"]
+
+# Random batches every sweep of local moves is split into. Nodes of a batch
+# move at the same time, so fewer batches are faster but converge in more
+# sweeps, to partitions of slightly lower modularity
+MOVE_BATCHES = 8
+
+
+class AuthorGraph(NamedTuple):
+    """
+    Undirected, weighted co-authorship graph in CSR form. Every edge is stored
+    in the rows of both of its authors
+    """
+
+    author_ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    weights: np.ndarray
+
+
+def _rows(indptr: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+def _degrees(indptr: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    return np.bincount(_rows(indptr), weights=weights, minlength=len(indptr) - 1)
+
+
+def _renumber(communities: np.ndarray) -> np.ndarray:
+    return np.unique(communities, return_inverse=True)[1]
+
+
+def load_author_graph(
+    neo4j_directory: Path,
+    min_count: int = FREQUENT_COLLABORATION_THRESHOLD,
+) -> AuthorGraph:
+    """
+    Load the COLLABORATED_WITH relationships written for neo4j import, keeping
+    the authors with at least one pair of `min_count` shared documents
+    """
+    df = read_neo4j_import(neo4j_directory, "rel_author_author", dtype=str)
+    df.columns = ["start", "end", "count"]
+    counts = df["count"].astype(np.int64).to_numpy()
+    df = df[counts >= min_count]
+    counts = counts[counts >= min_count]
+
+    codes, author_ids = pd.factorize(
+        pd.concat([df["start"], df["end"]], ignore_index=True), sort=True
+    )
+    starts, ends = codes[: len(df)], codes[len(df) :]
+    n = len(author_ids)
+
+    adjacency = sparse.csr_matrix(
+        (
+            np.concatenate([counts, counts]).astype(np.float64),
+            (np.concatenate([starts, ends]), np.concatenate([ends, starts])),
+        ),
+        shape=(n, n),
+    )
+    adjacency.sum_duplicates()
+    adjacency.sort_indices()
+
+    return AuthorGraph(
+        np.asarray(author_ids),
+        adjacency.indptr,
+        adjacency.indices,
+        adjacency.data,
+    )
+
+
+def modularity(
+    graph: AuthorGraph,
+    communities: np.ndarray,
+    resolution: float = 1.0,
+) -> float:
+    m2 = graph.weights.sum()
+    if not m2:
+        return 0.0
+
+    rows = _rows(graph.indptr)
+    internal = graph.weights[communities[rows] == communities[graph.indices]].sum()
+    totals = np.bincount(communities, weights=_degrees(graph.indptr, graph.weights))
+    return float(internal / m2 - resolution * np.sum(totals**2) / m2**2)
+
+
+def partition_drift(previous: np.ndarray, current: np.ndarray) -> dict:
+    """
+    How far a partition moved from an earlier one of the same nodes: their
+    normalized mutual information, and the fraction of nodes that are not in
+    the community matched to their previous one
+    """
+    if not len(previous):
+        return {"nmi": 1.0, "changed_fraction": 0.0}
+
+    previous = _renumber(previous)
+    current = _renumber(current)
+    pairs, counts = np.unique(np.stack([previous, current]), axis=1, return_counts=True)
+
+    p_joint = counts / counts.sum()
+    p_previous = np.bincount(pairs[0], weights=counts) / counts.sum()
+    p_current = np.bincount(pairs[1], weights=counts) / counts.sum()
+    mutual_information = np.sum(
+        p_joint * np.log(p_joint / (p_previous[pairs[0]] * p_current[pairs[1]]))
+    )
+    entropies = -np.sum(p_previous * np.log(p_previous)) - np.sum(
+        p_current * np.log(p_current)
+    )
+    nmi = 1.0 if entropies == 0 else 2 * mutual_information / entropies
+
+    # Communities are matched one to one, greedily by the number of nodes they
+    # share, so that both splits and merges count as changes
+    unchanged = 0
+    matched_previous, matched_current = set(), set()
+    for i in np.argsort(-counts, kind="stable").tolist():
+        p, c = pairs[0, i], pairs[1, i]
+        if p not in matched_previous and c not in matched_current:
+            matched_previous.add(p)
+            matched_current.add(c)
+            unchanged += counts[i]
+
+    return {
+        "nmi": float(nmi),
+        "changed_fraction": float(1 - unchanged / len(previous)),
+    }
+
+
+def _edges(indptr: np.ndarray, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Positions of the edges of `nodes` in the CSR arrays, and their rows
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum()), np.repeat(nodes, counts)
+
+
+def _best_targets(
+    rows: np.ndarray, targets: np.ndarray, gains: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Target with the largest gain of every row, ties going to the smallest.
+    Rows must be sorted, and targets sorted within each row, as `_links`
+    returns them
+    """
+    if not len(rows):
+        return rows, targets, gains
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    best_gains = np.maximum.reduceat(gains, starts)
+    best = np.flatnonzero(
+        gains == np.repeat(best_gains, np.diff(np.r_[starts, len(rows)]))
+    )
+    first = best[np.r_[True, rows[best[1:]] != rows[best[:-1]]]]
+    return rows[first], targets[first], gains[first]
+
+
+def _links(
+    rows: np.ndarray, targets: np.ndarray, weights: np.ndarray, n: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Weight between every row and each of its targets
+    keys, inverse = np.unique(rows.astype(np.int64) * n + targets, return_inverse=True)
+    return keys // n, keys % n, np.bincount(inverse, weights=weights)
+
+
+def _move_nodes(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    degrees: np.ndarray,
+    communities: np.ndarray,
+    m2: float,
+    rng: np.random.Generator,
+    resolution: float,
+    max_sweeps: int,
+) -> np.ndarray:
+    """
+    Move nodes to the neighbouring community with the largest modularity gain,
+    until a sweep moves no node. Every sweep visits the nodes in random
+    batches, and the nodes of a batch move at the same time, against the
+    community totals of the batch before. A singleton only moves into another
+    singleton with a smaller label, so that pairs of nodes cannot swap forever
+    """
+    n = len(degrees)
+    communities = communities.copy()
+
+    for _ in range(max_sweeps):
+        moves = 0
+        for batch in np.array_split(rng.permutation(n), MOVE_BATCHES):
+            totals = np.bincount(communities, weights=degrees, minlength=n)
+            sizes = np.bincount(communities, minlength=n)
+
+            edges, rows = _edges(indptr, batch)
+            not_loop = rows != indices[edges]
+            rows, targets, links = _links(
+                rows[not_loop],
+                communities[indices[edges[not_loop]]],
+                weights[edges[not_loop]],
+                n,
+            )
+
+            # Every node is taken out of its community before its gains
+            current = communities[rows]
+            k = degrees[rows]
+            gains = (
+                links
+                - resolution * (totals[targets] - k * (targets == current)) * k / m2
+            )
+
+            nodes, best, best_gains = _best_targets(rows, targets, gains)
+
+            # Staying has the gain of the links to the own community, if any
+            own_links = np.zeros(n)
+            own = targets == current
+            own_links[rows[own]] = links[own]
+            current, k = communities[nodes], degrees[nodes]
+            stay = own_links[nodes] - resolution * (totals[current] - k) * k / m2
+
+            move = (best_gains > stay) & (best != current)
+            move &= ~((sizes[current] == 1) & (sizes[best] == 1) & (best > current))
+
+            communities[nodes[move]] = best[move]
+            moves += np.count_nonzero(move)
+
+        if not moves:
+            break
+
+    return communities
+
+
+def _refine(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    degrees: np.ndarray,
+    communities: np.ndarray,
+    m2: float,
+    rng: np.random.Generator,
+    resolution: float,
+) -> np.ndarray:
+    """
+    Refinement of the communities into subcommunities. Unlike Leiden's, which
+    merges every singleton into a subcommunity drawn at random with
+    probabilities that grow with the modularity gain, this is a greedy merge:
+    well-connected singletons join the well-connected subcommunity of their
+    community with the largest positive gain. Singletons are visited in random
+    batches and merged at the same time, except for those that another one of
+    the batch joins
+    """
+    n = len(degrees)
+    rows = _rows(indptr)
+    same = (communities[rows] == communities[indices]) & (rows != indices)
+    rows, columns, same_weights = rows[same], indices[same], weights[same]
+    external = np.bincount(rows, weights=same_weights, minlength=n)
+    community_totals = np.bincount(communities, weights=degrees)[communities]
+
+    refined = np.arange(n)
+    connected = external >= resolution * degrees * (community_totals - degrees) / m2
+
+    for batch in np.array_split(rng.permutation(n), MOVE_BATCHES):
+        sizes = np.bincount(refined, minlength=n)
+        totals = np.bincount(refined, weights=degrees, minlength=n)
+        # Weight between each subcommunity and the rest of its community
+        cut = np.bincount(
+            refined[rows],
+            weights=same_weights * (refined[rows] != refined[columns]),
+            minlength=n,
+        )
+
+        batch = batch[connected[batch] & (refined[batch] == batch)]
+        batch = batch[sizes[batch] == 1]
+
+        edges, batch_rows = _edges(indptr, batch)
+        within = (communities[indices[edges]] == communities[batch_rows]) & (
+            indices[edges] != batch_rows
+        )
+        batch_rows, targets, links = _links(
+            batch_rows[within],
+            refined[indices[edges[within]]],
+            weights[edges[within]],
+            n,
+        )
+
+        k = degrees[batch_rows]
+        gains = links - resolution * k * totals[targets] / m2
+        total = community_totals[batch_rows]
+        well_connected = (
+            cut[targets]
+            >= resolution * totals[targets] * (total - totals[targets]) / m2
+        )
+        keep = well_connected & (gains > 0)
+
+        nodes, best, _ = _best_targets(batch_rows[keep], targets[keep], gains[keep])
+        # Singletons that others join in this batch stay where they are
+        joined = np.zeros(n, dtype=bool)
+        joined[best] = True
+        move = ~joined[nodes]
+        refined[nodes[move]] = best[move]
+
+    return refined
+
+
+def _aggregate(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    weights: np.ndarray,
+    communities: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    n = communities.max() + 1
+    rows = _rows(indptr)
+    aggregated = sparse.csr_matrix(
+        (weights, (communities[rows], communities[indices])), shape=(n, n)
+    )
+    aggregated.sum_duplicates()
+    return aggregated.indptr, aggregated.indices, aggregated.data
+
+
+def louvain(
+    graph: AuthorGraph,
+    seed: int = 0,
+    resolution: float = 1.0,
+    max_levels: int = 10,
+    max_iterations: int = 10,
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+    m2 = weights.sum()
+    membership = np.arange(len(indptr) - 1)
+    if not len(membership):
+        return membership
+
+    for _ in range(max_levels):
+        n = len(indptr) - 1
+        degrees = _degrees(indptr, weights)
+        communities = _move_nodes(
+            indptr,
+            indices,
+            weights,
+            degrees,
+            np.arange(n),
+            m2,
+            rng,
+            resolution,
+            max_iterations,
+        )
+        communities = _renumber(communities)
+        membership = communities[membership]
+        if communities.max() + 1 == n:
+            break
+
+        indptr, indices, weights = _aggregate(indptr, indices, weights, communities)
+
+    return membership
+
+
+def leiden(
+    graph: AuthorGraph,
+    seed: int = 0,
+    resolution: float = 1.0,
+    max_levels: int = 10,
+    max_iterations: int = 10,
+) -> np.ndarray:
+    """
+    Leiden with a greedy refinement instead of the randomized one of the
+    original algorithm, see `_refine`
+    """
+    rng = np.random.default_rng(seed)
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+    m2 = weights.sum()
+    membership = np.arange(len(indptr) - 1)
+    if not len(membership):
+        return membership
+    communities = membership.copy()
+
+    for _ in range(max_levels):
+        n = len(indptr) - 1
+        degrees = _degrees(indptr, weights)
+        communities = _move_nodes(
+            indptr,
+            indices,
+            weights,
+            degrees,
+            communities,
+            m2,
+            rng,
+            resolution,
+            max_iterations,
+        )
+        communities = _renumber(communities)
+        if communities.max() + 1 == n:
+            break
+
+        refined = _renumber(
+            _refine(indptr, indices, weights, degrees, communities, m2, rng, resolution)
+        )
+        if refined.max() + 1 == n:
+            break
+
+        # The aggregated graph has a node per refined community, and starts
+        # from the communities found before refinement
+        membership = refined[membership]
+        aggregated_communities = np.empty(refined.max() + 1, dtype=np.int64)
+        aggregated_communities[refined] = communities
+        communities = aggregated_communities
+
+        indptr, indices, weights = _aggregate(indptr, indices, weights, refined)
+
+    return _renumber(communities[membership])
+
+
+def label_propagation(
+    graph: AuthorGraph,
+    seed: int = 0,
+    max_iterations: int = 10,
+) -> np.ndarray:
+    """
+    Semi-synchronous weighted label propagation: in every iteration, a random
+    half of the nodes takes the label with the largest weight among their
+    neighbours, and then the other half does. Ties go to the smallest label
+    """
+    rng = np.random.default_rng(seed)
+    n = len(graph.indptr) - 1
+    rows = _rows(graph.indptr)
+    not_loop = rows != graph.indices
+    labels = np.arange(n)
+
+    for _ in range(max_iterations):
+        changed = 0
+        for half in np.array_split(rng.permutation(n), 2):
+            update = np.zeros(n, dtype=bool)
+            update[half] = True
+            mask = update[rows] & not_loop
+
+            keys = rows[mask].astype(np.int64) * n + labels[graph.indices[mask]]
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            totals = np.bincount(inverse, weights=graph.weights[mask])
+            nodes, candidates = unique_keys // n, unique_keys % n
+
+            order = np.lexsort((candidates, -totals, nodes))
+            first = order[np.unique(nodes[order], return_index=True)[1]]
+            new_labels = candidates[first]
+
+            changed += np.count_nonzero(labels[nodes[first]] != new_labels)
+            labels[nodes[first]] = new_labels
+
+        if not changed:
+            break
+
+    return _renumber(labels)
+
+
+def run_native(
+    graph: AuthorGraph,
+    algorithm: str,
+    seed: int,
+    max_iterations: int | None = None,
+) -> dict:
+    """
+    Run one algorithm, in the same form as `community_detection.run_single`
+    """
+    kwargs = {} if max_iterations is None else {"max_iterations": max_iterations}
+    functions = {
+        "labelPropagation": label_propagation,
+        "louvain": louvain,
+        "leiden": leiden,
+    }
+    if algorithm not in functions:
+        raise ValueError(f"Unknown algorithm {algorithm!r}")
+
+    start = time.perf_counter()
+    communities = functions[algorithm](graph, seed=seed, **kwargs)
+    seconds = time.perf_counter() - start
+
+    return {
+        "algorithm": algorithm,
+        "seed": seed,
+        "seconds": seconds,
+        "modularity": modularity(graph, communities),
+        "communities": communities,
+    }
+
+
+def analyze_native(
+    neo4j_directory: Path,
+    times: int = 10,
+    max_iterations: int | None = None,
+    output_path: Path | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run every algorithm `times` times over the author graph of an import
+    directory, without a database. Returns the runs and the communities of
+    the best one, which are also written to `output_path` if given
+    """
+    graph = load_author_graph(neo4j_directory)
+    log(
+        f"loaded author graph with {len(graph.author_ids)} authors and "
+        f"{len(graph.indices) // 2} edges"
+    )
+
+    runs = []
+    best = None
+    for algorithm in ALGORITHMS:
+        for seed in range(1, times + 1):
+            run = run_native(graph, algorithm, seed, max_iterations)
+            log(
+                f"{algorithm} modularity (seed {seed}): {run['modularity']} "
+                f"in {run['seconds']:.1f}s",
+            )
+            if best is None or run["modularity"] > best["modularity"]:
+                best = run
+            runs.append({k: v for k, v in run.items() if k != "communities"})
+
+    log(
+        f"best was {best['algorithm']} (seed {best['seed']}) "  # type: ignore
+        f"with modularity {best['modularity']}"  # type: ignore
+    )
+
+    df_communities = pd.DataFrame(
+        {
+            "scopus_id": graph.author_ids,
+            "community": best["communities"],  # type: ignore
+        }
+    )
+    if output_path is not None:
+        df_communities.to_csv(output_path, sep="\t", index=False)
+
+    return pd.DataFrame(runs), df_communities
+
+
+def benchmark(
+    neo4j_directory: Path,
+    times: int = 1,
+    concurrency: int = 4,
+    dataset: str | None = None,
+) -> pd.DataFrame:
+    """
+    Time the native algorithms against their GDS counterparts, over the same
+    graph. The database must hold the data of `neo4j_directory`
+    """
+    from graphology.analysis.community_detection import run_single
+    from graphology.analysis.projection import ProjectionManager
+
+    graph = load_author_graph(neo4j_directory)
+    projection = ProjectionManager(dataset).project()
+
+    rows = []
+    for algorithm in ALGORITHMS:
+        for seed in range(1, times + 1):
+            native = run_native(graph, algorithm, seed)
+            gds = run_single(projection, algorithm, seed, concurrency=concurrency)
+            rows.append(
+                {
+                    "algorithm": algorithm,
+                    "seed": seed,
+                    "native_seconds": native["seconds"],
+                    "gds_seconds": gds["seconds"],
+                    "native_modularity": native["modularity"],
+                    "gds_modularity": gds["modularity"],
+                }
+            )
+            log(
+                f"{algorithm} (seed {seed}): native {native['seconds']:.1f}s "
+                f"({native['modularity']:.4f}), gds {gds['seconds']:.1f}s "
+                f"({gds['modularity']:.4f})"
+            )
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # Usage: python -m graphology.analysis.native data/<run>/neo4j [output.tsv]
+    df_runs, _ = analyze_native(
+        Path(sys.argv[1]),
+        output_path=Path(sys.argv[2]) if len(sys.argv) > 2 else None,
+    )
+    print(df_runs)
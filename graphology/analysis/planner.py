@@ -0,0 +1,179 @@
+from typing import NamedTuple
+
+from graphology.analysis.projection import ProjectionManager
+from graphology.etl.load.gdbms.database import driver
+from graphology import log
+
+# Share of the available heap a plan may take, leaving the rest to the other
+# jobs running on the same instance
+HEAP_HEADROOM = 0.8
+
+# Every retained partition is a long per node
+PARTITION_BYTES_PER_NODE = 8
+
+
+class Plan(NamedTuple):
+    workers: int
+    concurrency: int
+    retain: str
+    required: int
+    available: int
+    report: str
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def available_heap() -> dict:
+    """
+    Heap the database can still hand out: what is free, plus what the JVM can
+    grow into
+    """
+    with driver.session() as session:
+        record = session.run(
+            """
+            CALL gds.systemMonitor()
+            YIELD freeHeap, totalHeap, maxHeap
+            RETURN freeHeap, totalHeap, maxHeap
+            """
+        ).single()
+
+    heap = record.data()  # type: ignore
+    heap["availableHeap"] = heap["freeHeap"] + heap["maxHeap"] - heap["totalHeap"]
+    return heap
+
+
+def estimate_run(
+    graph: str | dict,
+    algorithm: str,
+    concurrency: int,
+    max_iterations: int | None = None,
+) -> int:
+    """
+    Most memory one run of `algorithm` may need, over a projected graph or a
+    fictitious one given by its node and relationship counts
+    """
+    config = {
+        "mutateProperty": "estimate",
+        "relationshipWeightProperty": "count",
+        "concurrency": concurrency,
+    }
+    if max_iterations is not None:
+        config["maxLevels" if algorithm == "leiden" else "maxIterations"] = (
+            max_iterations
+        )
+
+    with driver.session() as session:
+        record = session.run(
+            f"""
+            CALL gds.{algorithm}.mutate.estimate($graph, $config)
+            YIELD bytesMax
+            RETURN bytesMax
+            """,  # type: ignore
+            graph=graph,
+            config=config,
+        ).single()
+    return record["bytesMax"]  # type: ignore
+
+
+def plan(
+    projection: ProjectionManager,
+    algorithms: list[str],
+    runs: int,
+    workers: int,
+    cores: int,
+    reproducible: bool = False,
+    retain: str = "all",
+    max_iterations: int | None = None,
+    headroom: float = HEAP_HEADROOM,
+) -> Plan:
+    """
+    Pick how many runs to start at a time, with which concurrency, and how
+    many partitions to retain, so that the projection and the runs fit the
+    heap. Retaining only the best partition is preferred over starting fewer
+    runs at a time, since it costs no time.
+
+    Raise an exception with the estimates if not even one run at a time fits
+    """
+    heap = available_heap()
+    budget = int(heap["availableHeap"] * headroom)
+    estimate = projection.memory_estimate()
+    nodes = estimate["nodeCount"]
+    projection_bytes = 0 if estimate["exists"] else estimate["bytesMax"]
+
+    # Before it exists, the projection is estimated as a fictitious graph of
+    # the same size
+    graph = (
+        estimate["graph"]
+        if estimate["exists"]
+        else {
+            "nodeCount": nodes,
+            "relationshipCount": estimate["relationshipCount"],
+            "nodeProjection": "*",
+            "relationshipProjection": {
+                "COLLABORATED": {
+                    "type": "*",
+                    "orientation": "UNDIRECTED",
+                    "properties": "count",
+                }
+            },
+        }
+    )
+
+    lines = [
+        f"available heap: {_format_bytes(heap['availableHeap'])} "
+        f"(free {_format_bytes(heap['freeHeap'])}, "
+        f"max {_format_bytes(heap['maxHeap'])}), "
+        f"budget {_format_bytes(budget)} at {headroom:.0%}",
+        f"projection {estimate['graph']}: {_format_bytes(estimate['bytesMax'])}"
+        + (" (already projected)" if estimate["exists"] else ""),
+    ]
+
+    estimates: dict[tuple[str, int], int] = {}
+    retain_modes = ["all", "best"] if retain == "all" else ["best"]
+    for candidate_workers in range(max(1, min(workers, runs)), 0, -1):
+        concurrency = 1 if reproducible else max(1, cores // candidate_workers)
+        for algorithm in algorithms:
+            if (algorithm, concurrency) not in estimates:
+                estimates[(algorithm, concurrency)] = estimate_run(
+                    graph, algorithm, concurrency, max_iterations
+                )
+        run_bytes = max((estimates[(a, concurrency)] for a in algorithms), default=0)
+
+        for mode in retain_modes:
+            # The best partition is kept along with those of the runs in
+            # progress
+            partitions = runs if mode == "all" else min(runs, candidate_workers + 1)
+            partition_bytes = partitions * nodes * PARTITION_BYTES_PER_NODE
+            required = (
+                projection_bytes + candidate_workers * run_bytes + partition_bytes
+            )
+            lines.append(
+                f"{candidate_workers} runs at a time with concurrency "
+                f"{concurrency} ({_format_bytes(run_bytes)} each), retaining "
+                f"{partitions} partitions ({_format_bytes(partition_bytes)}): "
+                f"{_format_bytes(required)}"
+            )
+
+            if required <= budget:
+                report = "\n".join(lines)
+                log(f"memory plan:\n{report}")
+                return Plan(
+                    candidate_workers,
+                    concurrency,
+                    mode,
+                    required,
+                    budget,
+                    report,
+                )
+
+    report = "\n".join(lines)
+    raise Exception(
+        "Unable to fit community detection in the heap, even one run at a "
+        f"time:\n{report}"
+    )
@@ -1,7 +1,240 @@
+import time
+
 from sqlmodel import Session, text
 
+from graphology.etl._cache import key_digest
+from graphology.etl._constants import DATASET_LABEL, FREQUENT_COLLABORATION_THRESHOLD
 from graphology.etl.load.rdbms.database import engine
 from graphology.etl.load.gdbms.database import driver
+from graphology import log
+
+GRAPH_PREFIX = "authorGraph"
+
+
+class ProjectionManager:
+    """
+    Projects the frequent collaborations between authors into the GDS graph
+    catalog, reusing the projection of an earlier run over the same data.
+
+    Projections are named after a fingerprint of the dataset, the data loaded
+    into the database, the filter, the weight property and the size of the
+    database, so an existing projection with the same name can be reused as is.
+    Projections with a seed property are the exception: seeds are rewritten by
+    every analysis, so they are always projected again
+    """
+
+    def __init__(
+        self,
+        dataset: str | None = None,
+        min_count: int = FREQUENT_COLLABORATION_THRESHOLD,
+        weight_property: str = "count",
+        drop_stale: bool = True,
+        seed_property: str | None = None,
+    ) -> None:
+        self.dataset = dataset
+        self.min_count = min_count
+        self.weight_property = weight_property
+        self.drop_stale = drop_stale
+        # Node property loaded along with the graph, to seed algorithms with
+        self.seed_property = seed_property
+
+    def _is_native(self, session) -> bool:
+        # Only the threshold used at import time has a relationship type, and
+        # databases imported before it existed do not have it
+        if self.min_count != FREQUENT_COLLABORATION_THRESHOLD:
+            return False
+        record = session.run(
+            """
+            CALL db.relationshipTypes() YIELD relationshipType
+            WHERE relationshipType = 'COLLABORATED_WITH_FREQUENTLY'
+            RETURN count(*) AS found
+            """
+        ).single()
+        return record["found"] > 0  # type: ignore
+
+    def _graph_name(self, session, native: bool) -> str:
+        record = session.run(
+            f"""
+            MATCH (a:Author)
+            WITH count(a) AS authors
+            MATCH ()-[r:COLLABORATED_WITH]->()
+            WITH authors, count(r) AS collaborations
+            OPTIONAL MATCH (d:{DATASET_LABEL})
+            RETURN authors, collaborations, d.fingerprint AS fingerprint
+            """
+        ).single()
+        fingerprint = key_digest(
+            "projection",
+            self.dataset,
+            record["fingerprint"],  # type: ignore
+            self.min_count,
+            self.weight_property,
+            self.seed_property,
+            native,
+            record["authors"],  # type: ignore
+            record["collaborations"],  # type: ignore
+        )
+        return f"{GRAPH_PREFIX}_{fingerprint[:12]}"
+
+    def estimate(self, session, native: bool) -> dict:
+        """
+        Memory needed by the projection. The Cypher projection cannot be
+        estimated, so the native projection of every co-authorship is used as
+        an upper bound for it
+        """
+        label, relationship_type = (
+            ("FrequentCollaborator", "COLLABORATED_WITH_FREQUENTLY")
+            if native
+            else ("Author", "COLLABORATED_WITH")
+        )
+        record = session.run(
+            """
+            CALL gds.graph.project.estimate({
+              label: {label: $label, properties: $node_properties}
+            }, {
+              relationships: {
+                type: $type,
+                orientation: 'UNDIRECTED',
+                properties: {count: {property: $weight}}
+              }
+            })
+            YIELD requiredMemory, bytesMin, bytesMax, nodeCount, relationshipCount
+            RETURN requiredMemory, bytesMin, bytesMax, nodeCount, relationshipCount
+            """,
+            label=label,
+            type=relationship_type,
+            weight=self.weight_property,
+            node_properties=[self.seed_property] if self.seed_property else [],
+        ).single()
+        return record.data()  # type: ignore
+
+    def memory_estimate(self) -> dict:
+        """
+        Estimate of the projection, along with its name and whether it has
+        already been projected, in which case its memory is already in use
+        """
+        with driver.session() as session:
+            native = self._is_native(session)
+            graph = self._graph_name(session, native)
+            record = session.run(
+                "CALL gds.graph.exists($graph) YIELD exists RETURN exists",
+                graph=graph,
+            ).single()
+            return {
+                "graph": graph,
+                "native": native,
+                "exists": record["exists"],  # type: ignore
+                **self.estimate(session, native),
+            }
+
+    def _drop_stale(self, session, graph: str) -> None:
+        session.run(
+            """
+            CALL gds.graph.list() YIELD graphName
+            WHERE graphName STARTS WITH $prefix AND graphName <> $graph
+            CALL gds.graph.drop(graphName) YIELD graphName AS dropped
+            RETURN dropped
+            """,
+            prefix=GRAPH_PREFIX,
+            graph=graph,
+        ).consume()
+
+    def project(self) -> str:
+        """
+        Project the graph unless it already is, and return its name
+        """
+        with driver.session() as session:
+            native = self._is_native(session)
+            if self.seed_property and not native:
+                raise Exception(
+                    "Unable to load seeds into a Cypher projection. Import the "
+                    "frequent collaborations to project them natively."
+                )
+            graph = self._graph_name(session, native)
+
+            record = session.run(
+                "CALL gds.graph.exists($graph) YIELD exists RETURN exists",
+                graph=graph,
+            ).single()
+            if record["exists"] and not self.seed_property:  # type: ignore
+                log(f"reusing projection {graph}")
+                return graph
+            if record["exists"]:  # type: ignore
+                log(f"reprojecting {graph} to reload {self.seed_property}")
+                session.run(
+                    "CALL gds.graph.drop($graph) YIELD graphName RETURN graphName",
+                    graph=graph,
+                ).consume()
+
+            if self.drop_stale:
+                self._drop_stale(session, graph)
+
+            estimate = self.estimate(session, native)
+            log(
+                f"projecting {graph} ({'native' if native else 'cypher'}), "
+                f"estimated memory: {estimate['requiredMemory']}"
+            )
+
+            start = time.perf_counter()
+            if native:
+                record = session.run(
+                    """
+                    CALL gds.graph.project($graph, {
+                      FrequentCollaborator: {properties: $node_properties}
+                    }, {
+                      COLLABORATED_WITH_FREQUENTLY: {
+                        orientation: 'UNDIRECTED',
+                        properties: {count: {property: $weight}}
+                      }
+                    })
+                    YIELD nodeCount, relationshipCount
+                    RETURN nodeCount, relationshipCount
+                    """,
+                    graph=graph,
+                    weight=self.weight_property,
+                    node_properties=(
+                        [self.seed_property] if self.seed_property else []
+                    ),
+                ).single()
+            else:
+                record = session.run(
+                    """
+                    MATCH (a1:Author)-[r:COLLABORATED_WITH]->(a2:Author)
+                    WHERE r.count >= $min_count
+                    WITH a1, a2, r
+                    WITH gds.graph.project(
+                      $graph,
+                      a1,
+                      a2,
+                      {
+                        relationshipProperties: {count: r[$weight]}
+                      },
+                      {
+                          undirectedRelationshipTypes: ['*']
+                      }
+                    ) AS g
+                    RETURN g.nodeCount AS nodeCount,
+                           g.relationshipCount AS relationshipCount
+                    """,
+                    graph=graph,
+                    min_count=self.min_count,
+                    weight=self.weight_property,
+                ).single()
+
+        log(
+            f"projected {graph} with {record['nodeCount']} nodes and "  # type: ignore
+            f"{record['relationshipCount']} relationships "  # type: ignore
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        return graph
+
+    def drop(self) -> None:
+        with driver.session() as session:
+            graph = self._graph_name(session, self._is_native(session))
+            session.run(
+                "CALL gds.graph.drop($graph, false) YIELD graphName RETURN graphName",
+                graph=graph,
+            ).consume()
 
 
 def get_projection_edges_from_rdbms():
@@ -0,0 +1,185 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from graphology import log
+
+# Same as in scipy's linregress, so that p-values match
+TINY = 1.0e-20
+
+
+def _periods(window: int) -> list[tuple[str, range]]:
+    # The reference year belongs to both periods
+    return [("before", range(-window, 1)), ("after", range(0, window + 1))]
+
+
+def _ols(
+    groups: np.ndarray, x: np.ndarray, y: np.ndarray, n_groups: int
+) -> dict[str, np.ndarray]:
+    """
+    Ordinary least squares of `y` over `x` for every group at once, computed
+    from centered grouped sums the way `linregress` computes it for one group
+    """
+    n = np.bincount(groups, minlength=n_groups).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.bincount(groups, weights=x, minlength=n_groups) / n
+        y_mean = np.bincount(groups, weights=y, minlength=n_groups) / n
+        dx = x - x_mean[groups]
+        dy = y - y_mean[groups]
+        ssxm = np.bincount(groups, weights=dx * dx, minlength=n_groups) / n
+        ssym = np.bincount(groups, weights=dy * dy, minlength=n_groups) / n
+        ssxym = np.bincount(groups, weights=dx * dy, minlength=n_groups) / n
+
+        degenerate = (ssxm == 0) | (ssym == 0)
+        r = np.where(
+            degenerate,
+            np.where(ssxym == 0, np.nan, 0.0),
+            np.clip(ssxym / np.sqrt(ssxm * ssym), -1.0, 1.0),
+        )
+        slope = ssxym / ssxm
+        intercept = y_mean - slope * x_mean
+
+        df = n - 2
+        t = r * np.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+        p_value = 2 * stats.t.sf(np.abs(t), df)
+        std_err = np.sqrt((1 - r**2) * ssym / ssxm / df)
+
+    # Two points always fit exactly
+    two = n == 2
+    p_value[two] = np.where(ssym[two] == 0, 1.0, 0.0)
+    std_err[two] = 0.0
+
+    return {
+        "n": n,
+        "slope": slope,
+        "intercept": intercept,
+        "p_value": p_value,
+        "std_err": std_err,
+    }
+
+
+def run_regressions(df: pd.DataFrame, col: str, window: int) -> pd.DataFrame:
+    """
+    Regress `col` over the year relative to the reference year, for every
+    author, once over the `window` years before it and once over the ones
+    after it. Authors with fewer than two years in a period are left out of
+    it, as in the notebook's `run_regressions`
+    """
+    results = []
+    for period, year_range in _periods(window):
+        subset = df[df["year"].isin(year_range)]
+        groups, authors = pd.factorize(subset["author_id"], sort=True)
+        known = groups >= 0
+
+        ols = _ols(
+            groups[known],
+            subset["year"].to_numpy(dtype=float)[known],
+            subset[col].to_numpy(dtype=float)[known],
+            len(authors),
+        )
+        fitted = ols["n"] >= 2
+        results.append(
+            pd.DataFrame(
+                {
+                    "author_id": authors[fitted],
+                    "slope": ols["slope"][fitted],
+                    "intercept": ols["intercept"][fitted],
+                    "p_value": ols["p_value"][fitted],
+                    "period": period,
+                    "std_err": ols["std_err"][fitted],
+                }
+            )
+        )
+
+    return pd.concat(results, ignore_index=True)
+
+
+def run_regressions_loop(df: pd.DataFrame, col: str, window: int) -> pd.DataFrame:
+    """
+    `run_regressions` as in the notebook, one `linregress` per author and
+    period
+    """
+    results = []
+    for period, year_range in _periods(window):
+        subset = df[df["year"].isin(year_range)]
+        for author_id, group in subset.groupby("author_id"):
+            x = group["year"]
+            y = group[col]
+            if len(x) >= 2:
+                result = stats.linregress(x, y)
+                results.append(
+                    {
+                        "author_id": author_id,
+                        "slope": result.slope,
+                        "intercept": result.intercept,
+                        "p_value": result.pvalue,
+                        "period": period,
+                        "std_err": result.stderr,
+                    }
+                )
+
+    return pd.DataFrame(results)
+
+
+def compare_slopes(df_regressions: pd.DataFrame) -> pd.DataFrame:
+    df_pivoted = df_regressions.pivot(
+        index="author_id", columns="period", values="slope"
+    ).reset_index()
+
+    df_pivoted = df_pivoted.dropna(subset=["before", "after"])
+    df_pivoted["slope_ratio"] = df_pivoted["after"] / df_pivoted["before"].replace(
+        0, pd.NA
+    )
+
+    return df_pivoted
+
+
+def benchmark(df: pd.DataFrame, col: str, window: int = 5) -> dict:
+    """
+    Time `run_regressions` against the notebook's loop over the same data,
+    and check that both give the same regressions
+    """
+    start = time.perf_counter()
+    df_vectorized = run_regressions(df, col, window)
+    vectorized_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df_loop = run_regressions_loop(df, col, window)
+    loop_seconds = time.perf_counter() - start
+
+    # Both are compared in the same order, and every output column within a
+    # tolerance, since the grouped sums and linregress round differently
+    keys = ["author_id", "period"]
+    columns = ["slope", "intercept", "p_value", "std_err"]
+    df_vectorized = df_vectorized.sort_values(keys, ignore_index=True)
+    df_loop = df_loop.reindex(columns=keys + columns).sort_values(
+        keys, ignore_index=True
+    )
+    mismatches = columns
+    if np.array_equal(df_vectorized[keys].to_numpy(), df_loop[keys].to_numpy()):
+        mismatches = [
+            column
+            for column in columns
+            if not np.allclose(
+                df_vectorized[column].to_numpy(dtype=float),
+                df_loop[column].to_numpy(dtype=float),
+                equal_nan=True,
+            )
+        ]
+    matches = not mismatches
+
+    report = {
+        "regressions": len(df_vectorized),
+        "vectorized_seconds": vectorized_seconds,
+        "loop_seconds": loop_seconds,
+        "matches": matches,
+        "mismatches": mismatches,
+    }
+    log(
+        f"{report['regressions']} regressions: vectorized "
+        f"{vectorized_seconds:.2f}s, loop {loop_seconds:.2f}s, "
+        f"{'matching' if matches else f'NOT matching on {mismatches}'}"
+    )
+    return report
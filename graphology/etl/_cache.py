@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from graphology.etl._helpers import cache_directory
+
+# Bump this whenever a change to the code alters the contents of an artifact,
+# so that artifacts cached by older code are not reused
+CACHE_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+FINGERPRINT_NAME = ".fingerprint"
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def key_digest(*parts: object) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _link(source: Path, destination: Path) -> None:
+    """
+    Hard link `source` to `destination`, falling back to a copy across file
+    systems. Files are only ever replaced (never rewritten in place), so sharing
+    them between the cache and the output directories is safe
+    """
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def read_fingerprint(directory: Path) -> str | None:
+    path = directory / FINGERPRINT_NAME
+    return path.read_text() if path.exists() else None
+
+
+def write_fingerprint(directory: Path, fingerprint: str | None) -> None:
+    """
+    Record the fingerprint of the inputs the files in `directory` were built
+    from. `None` clears it, which marks the directory as out of date
+    """
+    path = directory / FINGERPRINT_NAME
+    if fingerprint is None:
+        path.unlink(missing_ok=True)
+    else:
+        path.write_text(fingerprint)
+
+
+class ArtifactCache:
+    """
+    Content-addressed store of per-year artifacts, shared by every run in a data
+    directory regardless of its timestamp or year range
+    """
+
+    def __init__(self, data_directory: Path) -> None:
+        self.CACHE_DIRECTORY: Path = cache_directory(data_directory)
+
+    def _entry_path(self, stage: str, key: str) -> Path:
+        return self.CACHE_DIRECTORY / stage / key[:2] / key
+
+    def get(
+        self,
+        stage: str,
+        key: str,
+        max_age: timedelta | None = None,
+    ) -> Path | None:
+        entry = self._entry_path(stage, key)
+        if not (entry / MANIFEST_NAME).exists():
+            return None
+
+        if max_age is not None:
+            created_at = datetime.fromisoformat(self.manifest(entry)["created_at"])
+            if datetime.now() - created_at > max_age:
+                return None
+
+        return entry
+
+    def put(
+        self,
+        stage: str,
+        key: str,
+        files: list[Path],
+        metadata: dict | None = None,
+    ) -> Path:
+        entry = self._entry_path(stage, key)
+
+        # Build the entry next to its final location and move it into place, so
+        # readers never see a partially written entry
+        tmp_entry = entry.with_name(
+            f"{entry.name}.tmp-{os.getpid()}-{threading.get_ident()}"
+        )
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir(parents=True)
+
+        for f in files:
+            _link(f, tmp_entry / f.name)
+
+        manifest = {
+            "stage": stage,
+            "key": key,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "files": {f.name: file_digest(f) for f in files},
+            "metadata": metadata or {},
+        }
+        (tmp_entry / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp_entry, entry)
+        except OSError:
+            # Another worker stored the same artifact in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        return entry
+
+    def manifest(self, entry: Path) -> dict:
+        return json.loads((entry / MANIFEST_NAME).read_text())
+
+    def materialize(self, entry: Path, directory: Path) -> list[Path]:
+        """
+        Link the files of a cache entry into `directory`
+        """
+        paths = []
+        for name in self.manifest(entry)["files"]:
+            _link(entry / name, directory / name)
+            paths.append(directory / name)
+        return paths
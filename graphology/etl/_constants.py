@@ -1,3 +1,11 @@
 from pathlib import Path
 
 DATA_DIRECTORY: Path = Path("data")
+
+# Authors are considered to collaborate frequently when they share at least
+# this many documents. Only these collaborations are used to find communities
+FREQUENT_COLLABORATION_THRESHOLD: int = 2
+
+# Label of the node that records the fingerprint of the data loaded into the
+# graph database, so that projections of other data are not reused
+DATASET_LABEL: str = "Dataset"
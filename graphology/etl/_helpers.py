@@ -1,6 +1,9 @@
+import gzip
 from datetime import datetime
 from pathlib import Path
 
+import pandas as pd
+
 
 def now() -> str:
     timestamp: str = datetime.now().isoformat(timespec="seconds").replace(":", "-")
@@ -70,5 +73,122 @@ def neo4j_data_directory(
     )
 
 
+def neo4j_import_files(directory: Path, name: str) -> list[Path]:
+    """
+    Files of one neo4j import input: a header file followed by its compressed
+    parts, or a single plain file with its own header
+    """
+    header_path = directory / f"{name}.header.tsv"
+    if header_path.exists():
+        return [header_path, *sorted(directory.glob(f"{name}.part*.tsv.gz"))]
+    return [directory / f"{name}.tsv"]
+
+
+def read_neo4j_import(directory: Path, name: str, **kwargs) -> pd.DataFrame:
+    files = neo4j_import_files(directory, name)
+    if len(files) == 1:
+        return pd.read_csv(files[0], sep="\t", **kwargs)
+
+    header = pd.read_csv(files[0], sep="\t", nrows=0).columns
+    parts = [
+        pd.read_csv(part, sep="\t", header=None, names=header, **kwargs)
+        for part in files[1:]
+    ]
+    if not parts:
+        return pd.DataFrame(columns=header)
+    return pd.concat(parts, ignore_index=True)
+
+
+def iter_neo4j_import(directory: Path, name: str, chunksize: int, **kwargs):
+    """
+    `read_neo4j_import` in chunks of at most `chunksize` rows
+    """
+    files = neo4j_import_files(directory, name)
+    if len(files) == 1:
+        yield from pd.read_csv(files[0], sep="\t", chunksize=chunksize, **kwargs)
+        return
+
+    header = pd.read_csv(files[0], sep="\t", nrows=0).columns
+    for part in files[1:]:
+        yield from pd.read_csv(
+            part, sep="\t", header=None, names=header, chunksize=chunksize, **kwargs
+        )
+
+
+class Neo4jImportWriter:
+    """
+    Writes the rows of one neo4j import input as they come, either to a single
+    plain file or to a header file and gzip-compressed parts of at most
+    `part_rows` rows each, replacing the files it had before
+    """
+
+    def __init__(
+        self, directory: Path, name: str, columns, part_rows: int | None = None
+    ) -> None:
+        self.directory = directory
+        self.name = name
+        self.part_rows = part_rows
+        self.n_parts = 0
+        self.part_size = 0
+        self.part = None
+
+        (directory / f"{name}.tsv").unlink(missing_ok=True)
+        (directory / f"{name}.header.tsv").unlink(missing_ok=True)
+        for path in directory.glob(f"{name}.part*.tsv.gz"):
+            path.unlink()
+
+        header_name = f"{name}.tsv" if part_rows is None else f"{name}.header.tsv"
+        pd.DataFrame(columns=columns).to_csv(
+            directory / header_name, sep="\t", index=False
+        )
+
+    def _next_part(self):
+        if self.part is not None:
+            self.part.close()
+        self.part = gzip.open(
+            self.directory / f"{self.name}.part{self.n_parts:04d}.tsv.gz",
+            "wt",
+            compresslevel=1,
+            newline="",
+        )
+        self.n_parts += 1
+        self.part_size = 0
+
+    def write(self, df: pd.DataFrame):
+        if self.part_rows is None:
+            df.to_csv(
+                self.directory / f"{self.name}.tsv",
+                sep="\t",
+                index=False,
+                header=False,
+                mode="a",
+            )
+            return
+
+        start = 0
+        while start < len(df):
+            if self.part is None or self.part_size == self.part_rows:
+                self._next_part()
+            rows = df.iloc[start : start + self.part_rows - self.part_size]
+            rows.to_csv(self.part, sep="\t", index=False, header=False)
+            self.part_size += len(rows)
+            start += len(rows)
+
+    def close(self):
+        if self.part is not None:
+            self.part.close()
+            self.part = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def cache_directory(data_directory: Path) -> Path:
+    return data_directory / "cache"
+
+
 def is_empty(directory: Path):
     return not any(directory.iterdir())
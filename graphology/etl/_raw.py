@@ -0,0 +1,113 @@
+import os
+import pickle
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Pickle stores the full list of ScopusSearchResult namedtuples. The columnar
+# formats only keep the fields that are read by the transform stage:
+#
+# - parquet: zstd-compressed, smallest on disk
+# - arrow: uncompressed Arrow IPC, which can be memory-mapped without copies
+RAW_FORMATS: dict[str, str] = {
+    "pickle": ".pkl",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+RAW_FIELDS: list[str] = [
+    # Documents
+    "eid",
+    "title",
+    "doi",
+    "openaccess",
+    "coverDate",
+    "subtype",
+    "subtypeDescription",
+    "volume",
+    "issueIdentifier",
+    "pageRange",
+    "citedby_count",
+    "fund_acr",
+    "fund_no",
+    "fund_sponsor",
+    "publicationName",
+    "aggregationType",
+    "source_id",
+    "issn",
+    "eIssn",
+    # Institutions
+    "afid",
+    "affilname",
+    "affiliation_city",
+    "affiliation_country",
+    # Authors and authorships
+    "author_ids",
+    "author_names",
+    "author_afids",
+]
+
+
+def raw_file_path(directory: Path, year: int, raw_format: str) -> Path:
+    if raw_format not in RAW_FORMATS:
+        raise ValueError(
+            f"Unknown raw format {raw_format!r}, expected one of {list(RAW_FORMATS)}"
+        )
+    return directory / f"results_{year}{RAW_FORMATS[raw_format]}"
+
+
+def find_raw_file(directory: Path, year: int) -> Path | None:
+    for raw_format in RAW_FORMATS:
+        path = raw_file_path(directory, year, raw_format)
+        if path.exists():
+            return path
+    return None
+
+
+def write_raw(results: list, path: Path) -> None:
+    """
+    Atomically write a year of search results in the format given by the
+    suffix of `path`
+    """
+    tmp_path = path.with_name(f"{path.name}.tmp")
+
+    if path.suffix == RAW_FORMATS["pickle"]:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(results, f)
+    else:
+        table = pa.table(
+            {field: [getattr(r, field) for r in results] for field in RAW_FIELDS}
+        )
+        if path.suffix == RAW_FORMATS["parquet"]:
+            pq.write_table(table, tmp_path, compression="zstd")
+        else:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+    os.replace(tmp_path, path)
+
+
+def read_raw(path: Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Read a year of search results as a DataFrame with one row per document.
+    Columnar formats are memory-mapped and only the requested columns are read
+    """
+    columns = columns or RAW_FIELDS
+
+    if path.suffix == RAW_FORMATS["pickle"]:
+        with open(path, "rb") as f:
+            results = pickle.load(f)
+        if not results:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame.from_records(results, columns=results[0]._fields)
+        return df[columns]
+
+    if path.suffix == RAW_FORMATS["parquet"]:
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all().select(columns)
+        return table.to_pandas()
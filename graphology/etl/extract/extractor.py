@@ -1,11 +1,15 @@
-import pickle
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
 from pybliometrics.scopus import ScopusSearch, init as scopus_init
 
-from graphology.etl._helpers import is_empty, raw_data_directory_path
+from graphology.etl._helpers import raw_data_directory_path
+from graphology.etl._cache import CACHE_VERSION, ArtifactCache, key_digest
+from graphology.etl._raw import RAW_FIELDS, raw_file_path, read_raw, write_raw
 from graphology import log
 
 fields = (
@@ -20,6 +24,33 @@ fields = (
 )
 ScopusSearchResult = namedtuple("ScopusSearchResult", fields)
 
+# Cached search results older than this are searched again, so that citation
+# counts are refreshed
+RAW_CACHE_MAX_AGE = timedelta(days=7)
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most `calls_per_second` of them start per
+    second, no matter how many threads share the limiter
+    """
+
+    def __init__(self, calls_per_second: float | None) -> None:
+        self.interval: float = 1 / calls_per_second if calls_per_second else 0
+        self._lock = threading.Lock()
+        self._next_slot: float = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+
+        time.sleep(max(0, slot - now))
+
 
 class Extractor:
     def __init__(
@@ -28,6 +59,10 @@ class Extractor:
         start_year: int,
         end_year: int,
         data_directory: Path,
+        workers: int = 4,
+        searches_per_second: float | None = 2,
+        raw_format: str = "pickle",
+        cache_max_age: timedelta | None = RAW_CACHE_MAX_AGE,
     ) -> None:
         # This statement reads the credentials needed to access the Scopus API
         scopus_init()
@@ -35,27 +70,130 @@ class Extractor:
         self.timestamp = timestamp
         self.start_year: int = start_year
         self.end_year: int = end_year
+        self.workers: int = workers
+        self.raw_format: str = raw_format
+        # Only the start of every search is throttled. A search pages through
+        # its results with as many HTTP requests as it needs, which
+        # pybliometrics sends back to back, so this limits queries and not
+        # requests to the API
+        self.rate_limiter = RateLimiter(searches_per_second)
+        self.cache = ArtifactCache(data_directory)
+        self.cache_max_age: timedelta | None = cache_max_age
 
         self.RAW_DATA_DIRECTORY: Path = raw_data_directory_path(
             self.timestamp, start_year, end_year, data_directory
         )
         self.RAW_DATA_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
-    def fetch(self) -> None:
+    def _results_path(self, year: int) -> Path:
+        return raw_file_path(self.RAW_DATA_DIRECTORY, year, self.raw_format)
+
+    def _marker_path(self, year: int) -> Path:
+        return self.RAW_DATA_DIRECTORY / f"results_{year}.done"
+
+    def _is_complete(self, year: int) -> bool:
+        if self._marker_path(year).exists():
+            return True
+
+        # Data extracted before completion markers existed is accepted as long
+        # as it can be read back in full (i.e. it was not cut short by a crash)
+        results_path = self._results_path(year)
+        if not results_path.exists():
+            return False
+        try:
+            read_raw(results_path)
+        except Exception:
+            return False
+
+        self.cache.put(
+            "raw",
+            self._cache_key(year),
+            [results_path],
+            {"query": self._query(year), "year": year},
+        )
+        self._marker_path(year).touch()
+        return True
+
+    def missing_years(self) -> list[int]:
+        return [
+            year
+            for year in range(self.end_year, self.start_year - 1, -1)
+            if not self._is_complete(year)
+        ]
+
+    def _query(self, year: int) -> str:
         # Search parameters
         UNICAMP_AFFILIATION_ID = "60029570"
 
-        for year in range(self.end_year, self.start_year - 1, -1):
-            query = f"AF-ID({UNICAMP_AFFILIATION_ID}) AND PUBYEAR = {year}"
-            search = ScopusSearch(query, subscriber=True)
-            if search.results:
-                results = [ScopusSearchResult(*result) for result in search.results]
-                with open(self.RAW_DATA_DIRECTORY / f"results_{year}.pkl", "wb") as f:
-                    pickle.dump(results, f)
+        return f"AF-ID({UNICAMP_AFFILIATION_ID}) AND PUBYEAR = {year}"
+
+    def _cache_key(self, year: int) -> str:
+        return key_digest(
+            "raw", CACHE_VERSION, self._query(year), self.raw_format, RAW_FIELDS
+        )
+
+    def fetch_year(self, year: int) -> None:
+        query = self._query(year)
+
+        # Reuse the results of the same query from any earlier run
+        key = self._cache_key(year)
+        entry = self.cache.get("raw", key, self.cache_max_age)
+        if entry is not None:
+            self.cache.materialize(entry, self.RAW_DATA_DIRECTORY)
+            self._marker_path(year).touch()
             log(
-                f"finished extracting data from {year}",
+                f"reused cached search results for {year}",
                 self.timestamp,
             )
+            return
+
+        self.rate_limiter.wait()
+        search = ScopusSearch(query, subscriber=True)
+        files = []
+        if search.results:
+            results = [ScopusSearchResult(*result) for result in search.results]
+
+            # The file is written atomically, so a crash never leaves a
+            # truncated file behind under the final name
+            write_raw(results, self._results_path(year))
+            files.append(self._results_path(year))
+
+        self.cache.put("raw", key, files, {"query": query, "year": year})
+
+        # Years without any results are marked as complete too, so they are not
+        # searched again when the extraction is resumed
+        self._marker_path(year).touch()
+
+    def fetch(self, years: list[int] | None = None) -> None:
+        if years is None:
+            years = list(range(self.end_year, self.start_year - 1, -1))
+
+        failed_years: dict[int, Exception] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.fetch_year, year): year for year in years}
+            for future in as_completed(futures):
+                year = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed_years[year] = e
+                    log(
+                        f"failed to extract data from {year}: {e}",
+                        self.timestamp,
+                        logging.ERROR,
+                    )
+                    continue
+
+                log(
+                    f"finished extracting data from {year}",
+                    self.timestamp,
+                )
+
+        if failed_years:
+            raise Exception(
+                f"Unable to extract data from {sorted(failed_years)}. "
+                "Run the extraction again to fetch only the missing years."
+            )
 
         log(
             f"finished extracting data from all requested years",
@@ -63,12 +201,13 @@ class Extractor:
         )
 
     def extract(self):
-        # Do nothing if data has already been extracted
-        if not is_empty(self.RAW_DATA_DIRECTORY):
+        # Only fetch the years that have not been (fully) extracted yet
+        years = self.missing_years()
+        if not years:
             log(
                 "Skipped data extraction, because data has already been extracted.",
                 self.timestamp,
             )
             return
 
-        self.fetch()
+        self.fetch(years)
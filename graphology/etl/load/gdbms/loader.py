@@ -1,13 +1,198 @@
 from pathlib import Path
+import os
+import time
 import uuid
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-from graphology.etl._helpers import neo4j_data_directory
+import numpy as np
+import pandas as pd
+from neo4j.exceptions import ClientError
+
+from graphology.etl._cache import read_fingerprint
+from graphology.etl._constants import DATASET_LABEL
+from graphology.etl._helpers import (
+    cache_directory,
+    neo4j_data_directory,
+    neo4j_import_files,
+    read_neo4j_import,
+)
 
 from .database import driver
 from graphology import log
 
+# - offline: the database is stopped and rebuilt from scratch by neo4j-admin
+# - online: rows are merged into the running database in batches, so new data
+#   can be added without downtime. Nodes and authorships are never removed,
+#   but frequent collaborator labels and collaborations that are no longer in
+#   the data are
+LOAD_MODES = ["offline", "online"]
+
+# Schema of the graph database, as (kind, name, label, property). Constraints
+# are uniqueness constraints, which are backed by an index of their own
+SCHEMA = [
+    ("constraint", "author_scopus_id", "Author", "scopus_id"),
+    ("index", "range_author_name", "Author", "name"),
+    ("index", "range_author_community", "Author", "community"),
+    (
+        "index",
+        "range_author_community_institution",
+        "Author",
+        "community_institution",
+    ),
+    ("constraint", "document_scopus_id", "Document", "scopus_id"),
+    ("index", "range_document_doi", "Document", "doi"),
+    ("index", "range_document_title", "Document", "title"),
+    ("constraint", "institution_scopus_id", "Institution", "scopus_id"),
+    ("index", "range_institution_name", "Institution", "name"),
+    ("index", "range_institution_city", "Institution", "city"),
+    ("index", "range_institution_country", "Institution", "country"),
+    ("index", "range_authorship_key", "Authorship", "key"),
+    ("index", "range_authorship_author_id", "Authorship", "author_id"),
+    ("index", "range_authorship_document_id", "Authorship", "document_id"),
+    ("index", "range_authorship_institution_id", "Authorship", "institution_id"),
+]
+
+# Plain indexes that the constraints above replace
+LEGACY_INDEXES = [
+    "range_author_scopus_id",
+    "range_document_scopus_id",
+    "range_institution_scopus_id",
+]
+
+
+def schema_statement(kind: str, name: str, label: str, property: str) -> str:
+    if kind == "constraint":
+        return (
+            f"CREATE CONSTRAINT {name} IF NOT EXISTS "
+            f"FOR (n:{label}) REQUIRE n.{property} IS UNIQUE"
+        )
+    return f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.{property})"
+
+
+MERGE_NODES_QUERY = """
+UNWIND $rows AS row
+MERGE (n:{label} {{scopus_id: row.scopus_id}})
+SET n += row
+"""
+
+# Authorships imported by neo4j-admin have no natural key, which the online
+# mode merges them on, so it is derived from their properties the first time
+# they are loaded online
+SET_AUTHORSHIP_KEYS_QUERY = """
+MATCH (auth:Authorship) WHERE auth.key IS NULL
+CALL {{
+    WITH auth
+    SET auth.key = auth.document_id + '|' + auth.author_id + '|'
+        + coalesce(auth.institution_id, '')
+}} IN TRANSACTIONS OF {batch_size} ROWS
+"""
+
+MERGE_AUTHORSHIPS_QUERY = """
+UNWIND $rows AS row
+MERGE (auth:Authorship {key: row.key})
+SET auth += row
+"""
+
+# Relationships of authorships to the nodes they connect, merged separately so
+# that rows can be partitioned by the node at the other end, which is the one
+# shared by many authorships
+MERGE_AUTHORSHIP_RELATIONSHIPS_QUERY = """
+UNWIND $rows AS row
+MATCH (auth:Authorship {{key: row.key}})
+MATCH (n:{label} {{scopus_id: row.{column}}})
+MERGE (auth)-[:{type}]->(n)
+"""
+
+AUTHORSHIP_RELATIONSHIPS = [
+    ("INVOLVES_AUTHOR", "Author", "author_id"),
+    ("INVOLVES_DOCUMENT", "Document", "document_id"),
+    ("INVOLVES_INSTITUTION", "Institution", "institution_id"),
+]
+
+LABEL_FREQUENT_COLLABORATORS_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Author {scopus_id: row.scopus_id})
+SET a:FrequentCollaborator
+"""
+
+REMOVE_FREQUENT_COLLABORATORS_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Author {scopus_id: row.scopus_id})
+REMOVE a:FrequentCollaborator
+"""
+
+FREQUENT_COLLABORATORS_QUERY = """
+MATCH (a:Author:FrequentCollaborator)
+RETURN a.scopus_id AS scopus_id
+"""
+
+MERGE_COLLABORATIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (a1:Author {{scopus_id: row.start}})
+MATCH (a2:Author {{scopus_id: row.end}})
+MERGE (a1)-[c:{type}]->(a2)
+SET c.count = row.count
+"""
+
+DELETE_COLLABORATIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (:Author {{scopus_id: row.start}})-[c:{type}]->(:Author {{scopus_id: row.end}})
+DELETE c
+"""
+
+COLLABORATIONS_QUERY = """
+MATCH (a1:Author)-[:{type}]->(a2:Author)
+RETURN a1.scopus_id AS start, a2.scopus_id AS end
+"""
+
+# Files merged by the online mode
+ONLINE_FILES = [
+    "node_authors",
+    "node_documents",
+    "node_institutions",
+    "node_authorships",
+    "rel_author_author",
+    "rel_author_author_frequent",
+]
+
+DATASET_FINGERPRINT_QUERY = f"""
+MERGE (d:{DATASET_LABEL})
+SET d.fingerprint = $fingerprint
+"""
+
+GRAPH_IS_EMPTY_QUERY = """
+MATCH (a:Author)
+WITH a LIMIT 1
+RETURN count(a) = 0 AS empty
+"""
+
+
+def _round_robin(n_buckets: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Round and slot of every pair of buckets, such that every round pairs each
+    bucket with exactly one other. Pairs of a bucket with itself go to the
+    first round, along with the pair that bucket is already in
+    """
+    rounds = np.zeros((n_buckets, n_buckets), dtype=np.int64)
+    slots = np.zeros((n_buckets, n_buckets), dtype=np.int64)
+    n = n_buckets - 1
+    for r in range(n):
+        pairs = [(r, n)] + [
+            ((r + k) % n, (r - k) % n) for k in range(1, n_buckets // 2)
+        ]
+        for slot, (i, j) in enumerate(pairs):
+            rounds[i, j] = rounds[j, i] = r
+            slots[i, j] = slots[j, i] = slot
+            if r == 0:
+                slots[i, i] = slots[j, j] = slot
+    return rounds, slots
+
+
+def _run_batch(tx, query: str, rows: list[dict]) -> None:
+    tx.run(query, rows=rows).consume()
+
 
 class GDBMSLoader:
     def __init__(
@@ -16,32 +201,77 @@ class GDBMSLoader:
         start_year: int,
         end_year: int,
         data_directory: Path,
+        threads: int | None = None,
+        high_parallel_io: bool = True,
+        max_off_heap_memory: str | None = None,
+        mode: str = "offline",
+        batch_size: int = 10_000,
+        workers: int = 4,
+        index_timeout: float = 3600,
+        index_poll_interval: float = 5,
     ):
+        if mode not in LOAD_MODES:
+            raise ValueError(
+                f"Unknown load mode {mode!r}, expected one of {LOAD_MODES}"
+            )
+
         self.timestamp = timestamp
+        self.mode: str = mode
+        self.batch_size: int = batch_size
+        self.workers: int = workers
+        self.index_timeout: float = index_timeout
+        self.index_poll_interval: float = index_poll_interval
+        self.threads: int = threads or os.cpu_count() or 1
+        self.high_parallel_io: bool = high_parallel_io
+        self.max_off_heap_memory: str | None = max_off_heap_memory
         self.NEO4J_DATA_DIRECTORY: Path = neo4j_data_directory(
             timestamp, start_year, end_year, data_directory
         )
+        # Hashes of the rows already in the graph, shared by every run, so that
+        # online loads only merge new or changed rows
+        self.LOADED_DIRECTORY: Path = cache_directory(data_directory) / "neo4j"
+
+    def _files(self, name: str) -> str:
+        # Plain files or a header file followed by its compressed parts
+        files = neo4j_import_files(self.NEO4J_DATA_DIRECTORY, name)
+        return ",".join(str(f) for f in files)
 
     def _run_neo4j_admin(self) -> None:
-        """Runs a bash command and returns its output."""
+        """Runs a bash command and streams its output into the logs."""
+        tuning = f"--threads={self.threads} "
+        tuning += f"--high-parallel-io={'on' if self.high_parallel_io else 'off'} "
+        if self.max_off_heap_memory:
+            tuning += f"--max-off-heap-memory={self.max_off_heap_memory} "
+
         command = f"""
         sudo neo4j stop &&
         sudo neo4j-admin database import full \
           --delimiter="\t" \
-          --nodes=Author={self.NEO4J_DATA_DIRECTORY}/node_authors.tsv \
-          --nodes=Document={self.NEO4J_DATA_DIRECTORY}/node_documents.tsv \
-          --nodes=Institution={self.NEO4J_DATA_DIRECTORY}/node_institutions.tsv \
-          --nodes=Authorship={self.NEO4J_DATA_DIRECTORY}/node_authorships.tsv \
-          --relationships=INVOLVES_AUTHOR={self.NEO4J_DATA_DIRECTORY}/rel_authorship_author.tsv \
-          --relationships=INVOLVES_DOCUMENT={self.NEO4J_DATA_DIRECTORY}/rel_authorship_document.tsv \
-          --relationships=INVOLVES_INSTITUTION={self.NEO4J_DATA_DIRECTORY}/rel_authorship_institution.tsv \
-          --relationships=COLLABORATED_WITH={self.NEO4J_DATA_DIRECTORY}/rel_author_author.tsv \
+          --nodes=Author={self._files("node_authors")} \
+          --nodes=Document={self._files("node_documents")} \
+          --nodes=Institution={self._files("node_institutions")} \
+          --nodes=Authorship={self._files("node_authorships")} \
+          --relationships=INVOLVES_AUTHOR={self._files("rel_authorship_author")} \
+          --relationships=INVOLVES_DOCUMENT={self._files("rel_authorship_document")} \
+          --relationships=INVOLVES_INSTITUTION={self._files("rel_authorship_institution")} \
+          --relationships=COLLABORATED_WITH={self._files("rel_author_author")} \
+          --relationships=COLLABORATED_WITH_FREQUENTLY={self._files("rel_author_author_frequent")} \
+          {tuning} \
           --overwrite-destination \
           --verbose
         """
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        for line in process.stdout:  # type: ignore
+            if line.strip():
+                log(f"neo4j-admin: {line.rstrip()}", self.timestamp)
 
-        if result.returncode != 0:
+        if process.wait() != 0:
             raise Exception("Unable to populate neo4j database")
 
         log(
@@ -49,85 +279,316 @@ class GDBMSLoader:
             self.timestamp,
         )
 
-    def _create_indexes(self) -> None:
-        def create_author_indexes(tx):
-            statements = [
-                "CREATE INDEX range_author_scopus_id FOR (a:Author) ON (a.scopus_id)",
-                "CREATE INDEX range_author_name FOR (a:Author) ON (a.name)",
-            ]
-            for s in statements:
-                tx.run(s)
-
-            log(
-                f"finished creating indexes for Author nodes",
-                self.timestamp,
-            )
+    def _start_neo4j(self) -> None:
+        command = "sudo neo4j start"
+        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception("Unable to start neo4j")
+
+    def _create_schema(self) -> None:
+        """
+        Submit every index and constraint of `SCHEMA` at once, then wait for
+        all of them to be populated, logging how long each one took
+        """
+
+        def drop_legacy_indexes(tx):
+            for name in LEGACY_INDEXES:
+                tx.run(f"DROP INDEX {name} IF EXISTS")
+
+        def create_schema(tx):
+            for entry in SCHEMA:
+                tx.run(schema_statement(*entry))
+
+        names = [name for _, name, _, _ in SCHEMA]
+        start = time.perf_counter()
+        with driver.session() as session:
+            # Indexes must be dropped before constraints on the same property
+            # can be created
+            session.execute_write(drop_legacy_indexes)
+            session.execute_write(create_schema)
+
+            # Poll the population of the indexes until they are all online
+            pending = set(names)
+            while pending and time.perf_counter() - start < self.index_timeout:
+                records = session.run(
+                    "SHOW INDEXES YIELD name, state WHERE name IN $names "
+                    "RETURN name, state",
+                    names=list(pending),
+                )
+                for record in records:
+                    if record["state"] == "FAILED":
+                        raise Exception(f"Unable to populate index {record['name']}")
+                    if record["state"] == "ONLINE":
+                        pending.discard(record["name"])
+                        log(
+                            f"index {record['name']} populated in "
+                            f"{time.perf_counter() - start:.1f}s",
+                            self.timestamp,
+                        )
+                if pending:
+                    time.sleep(self.index_poll_interval)
+
+            remaining = max(1, int(self.index_timeout - (time.perf_counter() - start)))
+            try:
+                session.run(
+                    "CALL db.awaitIndexes($timeout)", timeout=remaining
+                ).consume()
+            except ClientError as e:
+                raise Exception(f"Unable to populate indexes {sorted(pending)}: {e}")
+
+        log(
+            f"finished creating all indexes in {time.perf_counter() - start:.1f}s",
+            self.timestamp,
+        )
+
+    def _read(self, name: str) -> pd.DataFrame:
+        df = read_neo4j_import(self.NEO4J_DATA_DIRECTORY, name, dtype=str)
 
-        def create_document_indexes(tx):
-            statements = [
-                "CREATE INDEX range_document_scopus_id FOR (d:Document) ON (d.scopus_id)",
-                "CREATE INDEX range_document_doi FOR (d:Document) ON (d.doi)",
-                "CREATE INDEX range_document_title FOR (d:Document) ON (d.title)",
-            ]
-            for s in statements:
-                tx.run(s)
-
-            log(
-                f"finished creating indexes for Document nodes",
-                self.timestamp,
+        # Drop the neo4j-admin type annotations, e.g. "scopus_id:ID(Author)"
+        df.columns = [
+            "labels" if column == ":LABEL" else column.split(":")[0]
+            for column in df.columns
+        ]
+        return df.astype(object).where(df.notna(), None)
+
+    def _partitions(self, df: pd.DataFrame, keys: list[str]) -> list[list[np.ndarray]]:
+        """
+        Rounds of row masks, one per session, such that the rows of different
+        sessions in a round never share a value of `keys`, which are the nodes
+        a row locks. With two keys, values are hashed into twice as many
+        buckets as workers, and every round gives each session a different
+        pair of buckets
+        """
+        if len(keys) == 1:
+            buckets = (
+                pd.util.hash_pandas_object(df[keys[0]], index=False) % self.workers
+            ).to_numpy()
+            return [[buckets == worker for worker in range(self.workers)]]
+
+        n_buckets = 2 * self.workers
+        start, end = [
+            (pd.util.hash_pandas_object(df[key], index=False) % n_buckets).to_numpy()
+            for key in keys
+        ]
+        rounds, slots = _round_robin(n_buckets)
+        row_rounds, row_slots = rounds[start, end], slots[start, end]
+        return [
+            [(row_rounds == r) & (row_slots == slot) for slot in range(self.workers)]
+            for r in range(n_buckets - 1)
+        ]
+
+    def _merge_partitioned(self, df: pd.DataFrame, keys: list[str], query: str) -> None:
+        """
+        Send `df` to `query` in batches from several sessions at once, with
+        rows partitioned by `keys` so that no two sessions lock the same node.
+        Transactions are run with `execute_write`, which retries them on
+        transient errors such as deadlocks
+        """
+
+        def merge_partition(mask: np.ndarray) -> None:
+            rows = df[mask].to_dict(orient="records")
+            with driver.session() as session:
+                for start in range(0, len(rows), self.batch_size):
+                    session.execute_write(
+                        _run_batch, query, rows[start : start + self.batch_size]
+                    )
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for masks in self._partitions(df, keys):
+                list(executor.map(merge_partition, masks))
+
+    def _merge_file(self, name: str, keys: list[str], query: str, df=None) -> None:
+        start = time.perf_counter()
+        if df is None:
+            df = self._read(name)
+        self._merge_partitioned(df, keys, query)
+
+        elapsed = time.perf_counter() - start
+        log(
+            f"merged {len(df)} rows of {name} in {elapsed:.1f}s "
+            f"({len(df) / elapsed:.0f} rows/s)",
+            self.timestamp,
+        )
+
+    def _record_fingerprint(self) -> None:
+        with driver.session() as session:
+            session.run(
+                DATASET_FINGERPRINT_QUERY,
+                fingerprint=read_fingerprint(self.NEO4J_DATA_DIRECTORY),
+            ).consume()
+
+    def _hashes(self, df: pd.DataFrame) -> np.ndarray:
+        # Authorship ids are random unless they are integers, so they are left
+        # out of the hashes
+        return pd.util.hash_pandas_object(
+            df.drop(columns=["id"], errors="ignore"), index=False
+        ).to_numpy()
+
+    def _loaded_path(self, name: str) -> Path:
+        return self.LOADED_DIRECTORY / f"{name}.npy"
+
+    def _unloaded(self, name: str) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Rows of `name` that are not in the graph yet, or that have changed
+        since they were loaded, along with the hashes of all of its rows
+        """
+        df = self._read(name)
+        hashes = self._hashes(df)
+        path = self._loaded_path(name)
+        if path.exists():
+            df = df[~np.isin(hashes, np.load(path))]
+        return df, hashes
+
+    def _removed(self, name: str, hashes: np.ndarray) -> bool:
+        """
+        Whether rows of `name` that were loaded before are no longer in it,
+        which is the case when collaborations fall below the threshold
+        """
+        path = self._loaded_path(name)
+        return path.exists() and not np.isin(np.load(path), hashes).all()
+
+    def _delete_stale(
+        self, name: str, df: pd.DataFrame, keys: list[str], query: str, delete: str
+    ) -> None:
+        """
+        Send the rows returned by `query` that are not in `df` to `delete`,
+        matching them on `keys`
+        """
+        start = time.perf_counter()
+        with driver.session() as session:
+            df_graph = pd.DataFrame(session.run(query).data(), columns=keys)
+        df_stale = df_graph.merge(
+            df[keys].drop_duplicates(), on=keys, how="left", indicator=True
+        )
+        df_stale = df_stale.loc[df_stale["_merge"] == "left_only", keys]
+        self._merge_partitioned(df_stale, keys, delete)
+
+        log(
+            f"removed {len(df_stale)} stale rows of {name} in "
+            f"{time.perf_counter() - start:.1f}s",
+            self.timestamp,
+        )
+
+    def _mark_loaded(self, name: str, hashes: np.ndarray, replace: bool = False):
+        path = self._loaded_path(name)
+        if not replace and path.exists():
+            hashes = np.union1d(np.load(path), hashes)
+        self.LOADED_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        np.save(path, np.unique(hashes))
+
+    def _load_online(self) -> None:
+        # Merges look nodes up through the constraints and indexes
+        self._create_schema()
+
+        # Rows recorded as loaded into a graph that has been emptied since
+        with driver.session() as session:
+            if session.run(GRAPH_IS_EMPTY_QUERY).single()["empty"]:
+                for name in ONLINE_FILES:
+                    self._loaded_path(name).unlink(missing_ok=True)
+
+        # Independent nodes
+        for label, name in [
+            ("Author", "node_authors"),
+            ("Document", "node_documents"),
+            ("Institution", "node_institutions"),
+        ]:
+            df, hashes = self._unloaded(name)
+            labels = df.pop("labels") if "labels" in df.columns else None
+            self._merge_file(
+                name, ["scopus_id"], MERGE_NODES_QUERY.format(label=label), df=df
             )
 
-        def create_institution_indexes(tx):
-            statements = [
-                "CREATE INDEX range_institution_scopus_id FOR (i:Institution) ON (i.scopus_id)",
-                "CREATE INDEX range_institution_name FOR (i:Institution) ON (i.name)",
-                "CREATE INDEX range_institution_city FOR (i:Institution) ON (i.city)",
-                "CREATE INDEX range_institution_country FOR (i:Institution) ON (i.country)",
-            ]
-            for s in statements:
-                tx.run(s)
-
-            log(
-                f"finished creating indexes for Intitution nodes",
-                self.timestamp,
+            # Extra labels, which only authors with frequent collaborations
+            # have. Authors whose collaborations are no longer frequent lose it
+            removed = False
+            if labels is not None:
+                self._merge_file(
+                    name,
+                    ["scopus_id"],
+                    LABEL_FREQUENT_COLLABORATORS_QUERY,
+                    df=df.loc[labels == "FrequentCollaborator", ["scopus_id"]],
+                )
+                removed = self._removed(name, hashes)
+                if removed:
+                    df = self._read(name)
+                    self._delete_stale(
+                        name,
+                        df[df["labels"] == "FrequentCollaborator"],
+                        ["scopus_id"],
+                        FREQUENT_COLLABORATORS_QUERY,
+                        REMOVE_FREQUENT_COLLABORATORS_QUERY,
+                    )
+            self._mark_loaded(name, hashes, replace=removed)
+
+        # Authorships, then their relationships to the nodes they connect.
+        # Their natural key stays the same across runs, unlike their ids
+        with driver.session() as session:
+            session.run(
+                SET_AUTHORSHIP_KEYS_QUERY.format(batch_size=self.batch_size)
+            ).consume()
+        df, hashes = self._unloaded("node_authorships")
+        df["key"] = (
+            df["document_id"]
+            + "|"
+            + df["author_id"]
+            + "|"
+            + df["institution_id"].fillna("")
+        )
+        self._merge_file("node_authorships", ["key"], MERGE_AUTHORSHIPS_QUERY, df=df)
+        for relationship_type, label, column in AUTHORSHIP_RELATIONSHIPS:
+            self._merge_file(
+                "node_authorships",
+                [column],
+                MERGE_AUTHORSHIP_RELATIONSHIPS_QUERY.format(
+                    type=relationship_type, label=label, column=column
+                ),
+                df=df.loc[df[column].notna(), ["key", column]],
             )
+        self._mark_loaded("node_authorships", hashes)
 
-        def create_authorship_indexes(tx):
-            statements = [
-                "CREATE INDEX range_authorship_author_id FOR (auth:Authorship) ON (auth.author_id)",
-                "CREATE INDEX range_authorship_document_id FOR (auth:Authorship) ON (auth.document_id)",
-                "CREATE INDEX range_authorship_institution_id FOR (auth:Authorship) ON (auth.institution_id)",
-            ]
-            for s in statements:
-                tx.run(s)
-
-            log(
-                f"finished creating indexes for Authorship nodes",
-                self.timestamp,
+        for relationship_type, name in [
+            ("COLLABORATED_WITH", "rel_author_author"),
+            ("COLLABORATED_WITH_FREQUENTLY", "rel_author_author_frequent"),
+        ]:
+            df, hashes = self._unloaded(name)
+            df = df.set_axis(["start", "end", "count"], axis=1)
+            df["count"] = df["count"].astype(int)
+            self._merge_file(
+                name,
+                ["start", "end"],
+                MERGE_COLLABORATIONS_QUERY.format(type=relationship_type),
+                df=df,
             )
 
-        # First, start the database
-        command = "sudo neo4j start"
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception("Unable to create neo4j indexes")
-
-        # Then, run the indexing commands
-        indexing_functions = [
-            create_author_indexes,
-            create_document_indexes,
-            create_institution_indexes,
-            create_authorship_indexes,
-        ]
-        with driver.session() as session:
-            for f in indexing_functions:
-                session.execute_write(f)
+            # Collaborations that have fallen below the threshold, or whose
+            # authors are no longer related, are deleted
+            removed = self._removed(name, hashes)
+            if removed:
+                self._delete_stale(
+                    name,
+                    self._read(name).set_axis(["start", "end", "count"], axis=1),
+                    ["start", "end"],
+                    COLLABORATIONS_QUERY.format(type=relationship_type),
+                    DELETE_COLLABORATIONS_QUERY.format(type=relationship_type),
+                )
+            self._mark_loaded(name, hashes, replace=removed)
 
+        self._record_fingerprint()
         log(
-            f"finished creating all indexes",
+            f"finished populating graph database",
             self.timestamp,
         )
 
     def load(self):
+        if self.mode == "online":
+            self._load_online()
+            return
+
         self._run_neo4j_admin()
-        self._create_indexes()
+        self._start_neo4j()
+        self._create_schema()
+        self._record_fingerprint()
+
+        # The graph now holds exactly the imported rows
+        for name in ONLINE_FILES:
+            self._mark_loaded(name, self._hashes(self._read(name)), replace=True)
@@ -1,5 +1,11 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import keyring
+from sqlalchemy import ForeignKeyConstraint, inspect, text
 from sqlalchemy.engine import URL
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable, DropIndex
 from sqlmodel import SQLModel, create_engine
 
 # NOTE: for SQLModel.create_all() to work, SQLModel and all models need to
@@ -42,5 +48,177 @@ DATABASE_URL = URL.create(**url_kwargs)
 engine = create_engine(DATABASE_URL, **engine_kwargs)
 
 
+def pooled_engine(connections: int):
+    """
+    Engine that keeps at least `connections` pooled connections, so that as
+    many workers can each hold one at the same time
+    """
+    if connections <= engine.pool.size():
+        return engine
+    return create_engine(DATABASE_URL, **engine_kwargs, pool_size=connections)
+
+
 def init_db():
     SQLModel.metadata.create_all(engine)
+
+
+# Natural key of authorships, which the copy and chunked load modes rely on to
+# skip rows that are already loaded. Missing institutions count as equal, like
+# they do in the merged data, which needs PostgreSQL 15 or later
+AUTHORSHIP_NATURAL_KEY = "authorship_natural_key"
+AUTHORSHIP_NATURAL_KEY_COLUMNS = ["document_id", "author_id", "institution_id"]
+
+
+def add_authorship_natural_key() -> int:
+    """
+    Add the natural key of authorships unless the table already has it,
+    deleting the duplicated rows that earlier loads may have left first, and
+    keeping the oldest of each. Returns the number of rows deleted
+    """
+    with engine.begin() as connection:
+        version = connection.execute(text("SHOW server_version_num")).scalar()
+        if int(version) < 150000:  # type: ignore
+            raise Exception(
+                "Unable to add the natural key of authorships, because it needs "
+                "PostgreSQL 15 or later. Use the orm load mode instead."
+            )
+
+        existing = {
+            constraint["name"]
+            for constraint in inspect(connection).get_unique_constraints("authorship")
+        }
+        if AUTHORSHIP_NATURAL_KEY in existing:
+            return 0
+
+        n_deleted = connection.execute(
+            text(
+                "DELETE FROM authorship a USING authorship b "
+                "WHERE a.key > b.key "
+                "AND a.document_id = b.document_id "
+                "AND a.author_id = b.author_id "
+                "AND a.institution_id IS NOT DISTINCT FROM b.institution_id"
+            )
+        ).rowcount
+        columns = ", ".join(AUTHORSHIP_NATURAL_KEY_COLUMNS)
+        connection.execute(
+            text(
+                f'ALTER TABLE authorship ADD CONSTRAINT "{AUTHORSHIP_NATURAL_KEY}" '
+                f"UNIQUE NULLS NOT DISTINCT ({columns})"
+            )
+        )
+    return n_deleted
+
+
+def _foreign_key_name(foreign_key: ForeignKeyConstraint) -> str:
+    # The name PostgreSQL gives the constraints created by create_all()
+    columns = "_".join(column.name for column in foreign_key.columns)
+    return f"{foreign_key.table.name}_{columns}_fkey"
+
+
+def _secondary_indexes():
+    return [
+        index for table in SQLModel.metadata.sorted_tables for index in table.indexes
+    ]
+
+
+def _foreign_keys():
+    return [
+        foreign_key
+        for table in SQLModel.metadata.sorted_tables
+        for foreign_key in table.foreign_key_constraints
+    ]
+
+
+def init_db_deferred():
+    """
+    Create the tables with their primary keys only. Secondary indexes and
+    foreign keys of tables that already exist are dropped, so that rows can be
+    bulk loaded without maintaining them. They are rebuilt by
+    `build_deferred_constraints`
+    """
+    with engine.begin() as connection:
+        existing_tables = set(inspect(connection).get_table_names())
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                connection.execute(
+                    CreateTable(table, include_foreign_key_constraints=[])
+                )
+
+        for foreign_key in _foreign_keys():
+            connection.execute(
+                text(
+                    f'ALTER TABLE "{foreign_key.table.name}" DROP CONSTRAINT '
+                    f'IF EXISTS "{_foreign_key_name(foreign_key)}"'
+                )
+            )
+        for index in _secondary_indexes():
+            connection.execute(DropIndex(index, if_exists=True))
+
+
+def build_deferred_constraints(
+    workers: int = 4,
+    maintenance_work_mem: str = "1GB",
+) -> dict[str, float]:
+    """
+    Build the secondary indexes in parallel, then add the foreign keys without
+    checking existing rows and validate them afterwards. Returns the time taken
+    by each phase, in seconds
+    """
+    timings = {}
+
+    def build_index(index):
+        # SET LOCAL only lasts until the end of the transaction, so the setting
+        # does not stay on the connection once it goes back to the pool
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"SET LOCAL maintenance_work_mem = '{maintenance_work_mem}'")
+            )
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(build_index, _secondary_indexes()))
+    timings["indexes"] = time.perf_counter() - start
+
+    # NOT VALID constraints are only checked for new rows, so adding them only
+    # takes a brief lock
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for foreign_key in _foreign_keys():
+            name = _foreign_key_name(foreign_key)
+            table = foreign_key.table.name
+            columns = ", ".join(f'"{c.name}"' for c in foreign_key.columns)
+            referred_table = foreign_key.referred_table.name
+            referred_columns = ", ".join(
+                f'"{element.column.name}"' for element in foreign_key.elements
+            )
+            connection.execute(
+                text(f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{name}"')
+            )
+            connection.execute(
+                text(
+                    f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" '
+                    f'FOREIGN KEY ({columns}) REFERENCES "{referred_table}" '
+                    f"({referred_columns}) NOT VALID"
+                )
+            )
+    timings["foreign_keys"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for foreign_key in _foreign_keys():
+        name = _foreign_key_name(foreign_key)
+        with engine.connect() as connection:
+            try:
+                connection.execute(
+                    text(
+                        f'ALTER TABLE "{foreign_key.table.name}" '
+                        f'VALIDATE CONSTRAINT "{name}"'
+                    )
+                )
+                connection.commit()
+            except DBAPIError as e:
+                connection.rollback()
+                raise Exception(f"Unable to validate constraint {name}: {e.orig}")
+    timings["validation"] = time.perf_counter() - start
+
+    return timings
@@ -1,11 +1,25 @@
+import json
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session
+import psycopg2
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlmodel import Session, select
+from tqdm import tqdm
 import pandas as pd
 
-from graphology.etl.load.rdbms.database import engine, init_db
+from graphology.etl.load.rdbms.database import (
+    add_authorship_natural_key,
+    build_deferred_constraints,
+    init_db,
+    init_db_deferred,
+    pooled_engine,
+)
+from graphology.etl._cache import key_digest, read_fingerprint
 from graphology.etl._helpers import merged_data_directory
 from graphology.etl.load.rdbms.entities import (
     Author,
@@ -15,6 +29,33 @@ from graphology.etl.load.rdbms.entities import (
 )
 from graphology import log
 
+# - orm: rows are read with pandas and inserted through SQLAlchemy
+# - copy: files are streamed with COPY into a staging table, and cast on the
+#   server as they are moved into the final table
+# - chunked: rows are inserted and committed a chunk at a time, skipping
+#   conflicting rows, so a failed load can be resumed from the last chunk
+#
+# copy and chunked skip authorships already loaded through their natural key,
+# which needs PostgreSQL 15 or later
+LOAD_MODES = ["orm", "copy", "chunked"]
+
+# Server-side casts from the text columns of the staging tables. Other columns
+# are text in the final tables too
+COPY_CASTS = {
+    "openaccess": (
+        "CASE lower({column}) WHEN 'true' THEN true WHEN 'false' THEN false "
+        "ELSE NULLIF({column}, '')::numeric <> 0 END"
+    ),
+    "date": "NULLIF({column}, '')::timestamp",
+    "citedby_count": "NULLIF({column}, '')::numeric::integer",
+    "first_author": "NULLIF({column}, '')::boolean",
+}
+
+# Authorships are split into this many files to be loaded in parallel. The
+# split does not depend on the number of workers, so that the files and their
+# checkpoints stay valid when a load is resumed with a different one
+AUTHORSHIP_PARTITIONS = 16
+
 
 class RDBMSLoader:
     def __init__(
@@ -23,17 +64,52 @@ class RDBMSLoader:
         start_year: int,
         end_year: int,
         data_directory: Path,
+        mode: str = "orm",
+        chunk_size: int = 10_000,
+        resume: bool = True,
+        defer_constraints: bool = False,
+        index_workers: int = 4,
+        maintenance_work_mem: str = "1GB",
+        workers: int = 1,
     ) -> None:
+        if mode not in LOAD_MODES:
+            raise ValueError(
+                f"Unknown load mode {mode!r}, expected one of {LOAD_MODES}"
+            )
+
         self.timestamp = timestamp
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.resume = resume
+        self.defer_constraints = defer_constraints
+        self.index_workers = index_workers
+        self.maintenance_work_mem = maintenance_work_mem
+        self.workers = workers
+        self.engine = pooled_engine(workers)
+        # Tables found empty before loading, whose checkpoints are stale
+        self.empty_tables: set[str] = set()
         self.MERGED_DATA_DIRECTORY: Path = merged_data_directory(
             self.timestamp, start_year, end_year, data_directory
         )
         self.MERGED_DATA_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
-        init_db()
+        if defer_constraints:
+            init_db_deferred()
+        else:
+            init_db()
+
+        if mode in ["copy", "chunked"]:
+            n_deleted = add_authorship_natural_key()
+            if n_deleted:
+                log(
+                    f"deleted {n_deleted} duplicated authorships to add their "
+                    "natural key",
+                    self.timestamp,
+                    logging.WARNING,
+                )
 
     def _batch_insert(self, model, mappings):
-        with Session(engine) as session:
+        with Session(self.engine) as session:
             try:
                 session.bulk_insert_mappings(model, mappings)
                 session.commit()
@@ -43,7 +119,236 @@ class RDBMSLoader:
                 )
                 session.rollback()
 
+    def _copy(self, tsv_name: str, model, distinct: bool = False):
+        """
+        Stream a merged TSV file into the table of `model` with COPY, through a
+        temporary staging table of text columns
+        """
+        tsv_path = self.MERGED_DATA_DIRECTORY / tsv_name
+        with open(tsv_path) as f:
+            header = f.readline().rstrip("\n").split("\t")
+
+        table = model.__tablename__
+        staging_table = f"staging_{table}"
+        columns = ", ".join(f'"{column}"' for column in header)
+        staging_columns = ", ".join(f'"{column}" text' for column in header)
+        casts = ", ".join(
+            COPY_CASTS.get(column, "NULLIF({column}, '')").format(column=f'"{column}"')
+            for column in header
+        )
+
+        start = time.perf_counter()
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMP TABLE {staging_table} ({staging_columns}) "
+                    "ON COMMIT DROP"
+                )
+                with open(tsv_path) as f:
+                    cursor.copy_expert(
+                        f"COPY {staging_table} ({columns}) FROM STDIN "
+                        "WITH (FORMAT csv, DELIMITER E'\\t', HEADER true)",
+                        f,
+                    )
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) "
+                    f"SELECT {'DISTINCT ' if distinct else ''}{casts} "
+                    f"FROM {staging_table} "
+                    "ON CONFLICT DO NOTHING"
+                )
+                n_rows = cursor.rowcount
+            connection.commit()
+        except psycopg2.Error as e:
+            logging.warning(
+                f"Ignored invalid entries for {model}. Exception caught: {e}"
+            )
+            connection.rollback()
+            return
+        finally:
+            connection.close()
+
+        log(
+            f"copied {n_rows} rows into {table} in {time.perf_counter() - start:.1f}s",
+            self.timestamp,
+        )
+
+    def _checkpoint_path(self, tsv_name: str) -> Path:
+        return self.MERGED_DATA_DIRECTORY / f"{Path(tsv_name).stem}.checkpoint"
+
+    def _checkpoint_fingerprint(self, tsv_name: str) -> str | None:
+        merged_fingerprint = read_fingerprint(self.MERGED_DATA_DIRECTORY)
+        if merged_fingerprint is None:
+            return None
+        return key_digest(
+            "checkpoint", merged_fingerprint, tsv_name, AUTHORSHIP_PARTITIONS
+        )
+
+    def _read_checkpoint(self, tsv_name: str, model) -> tuple[int, bool]:
+        """
+        Number of rows of `tsv_name` read by an earlier load, and whether it
+        finished. Checkpoints of other merged data, or of a table that has been
+        emptied since, are ignored
+        """
+        path = self._checkpoint_path(tsv_name)
+        fingerprint = self._checkpoint_fingerprint(tsv_name)
+        if (
+            not self.resume
+            or not path.exists()
+            or fingerprint is None
+            or model.__tablename__ in self.empty_tables
+        ):
+            return 0, False
+
+        try:
+            checkpoint = json.loads(path.read_text())
+        except ValueError:
+            return 0, False
+        if not isinstance(checkpoint, dict):
+            return 0, False
+        if checkpoint.get("fingerprint") != fingerprint:
+            return 0, False
+        return checkpoint["rows"], checkpoint["finished"]
+
+    def _write_checkpoint(self, tsv_name: str, n_read: int, finished: bool = False):
+        self._checkpoint_path(tsv_name).write_text(
+            json.dumps(
+                {
+                    "fingerprint": self._checkpoint_fingerprint(tsv_name),
+                    "rows": n_read,
+                    "finished": finished,
+                }
+            )
+        )
+
+    def _empty_tables(self) -> set[str]:
+        with Session(self.engine) as session:
+            return {
+                model.__tablename__
+                for model in [Author, Document, Institution, Authorship]
+                if session.exec(select(model).limit(1)).first() is None
+            }
+
+    def _insert_chunk(self, model, mappings) -> list[tuple[dict, Exception]]:
+        """
+        Insert and commit one chunk of rows, skipping the ones whose keys are
+        already in the table. If the chunk fails as a whole, its rows are
+        retried one by one, and the ones that still fail are returned
+        """
+        statement = insert(model).on_conflict_do_nothing()
+        with Session(self.engine) as session:
+            try:
+                session.execute(statement, mappings)
+                session.commit()
+                return []
+            except DBAPIError:
+                session.rollback()
+
+            failed = []
+            for mapping in mappings:
+                try:
+                    session.execute(statement, [mapping])
+                    session.commit()
+                except DBAPIError as e:
+                    session.rollback()
+                    failed.append((mapping, e))
+            return failed
+
+    def _load_chunked(self, tsv_name: str, model, dtype: dict | None = None):
+        """
+        Insert a merged TSV file a chunk at a time, committing each chunk and
+        recording how many rows were read, so that an interrupted load picks up
+        where it stopped. Rows that cannot be inserted are written to
+        `<file>.failed.tsv` along with the error they raised
+        """
+        tsv_path = self.MERGED_DATA_DIRECTORY / tsv_name
+        table = model.__tablename__
+        failed_path = self.MERGED_DATA_DIRECTORY / f"{tsv_path.stem}.failed.tsv"
+
+        n_done, finished = self._read_checkpoint(tsv_name, model)
+        if finished:
+            log(
+                f"Skipped loading {tsv_name}, because it has already been loaded.",
+                self.timestamp,
+            )
+            return
+        if n_done == 0:
+            failed_path.unlink(missing_ok=True)
+
+        # Only used for progress, as quoted values may span several lines
+        with open(tsv_path) as f:
+            n_lines = sum(1 for _ in f) - 1
+
+        # Rows read before are parsed again and skipped, rather than skipped
+        # by line, so that they are counted the same way as when they were read
+        reader = pd.read_csv(
+            tsv_path,
+            sep="\t",
+            dtype=dtype,
+            chunksize=self.chunk_size,
+        )
+
+        n_read = 0
+        n_failed = 0
+        start = time.perf_counter()
+        with tqdm(
+            total=n_lines, initial=n_done, unit="rows", desc=tsv_path.stem
+        ) as progress:
+            for chunk in reader:
+                chunk_start = n_read
+                n_read += len(chunk)
+                if n_read <= n_done:
+                    continue
+                chunk = chunk.iloc[max(n_done - chunk_start, 0) :]
+                n_new = len(chunk)
+
+                chunk = chunk.drop_duplicates()
+                chunk = chunk.where(pd.notnull(chunk), None)
+
+                failed = self._insert_chunk(model, chunk.to_dict(orient="records"))
+                if failed:
+                    n_failed += len(failed)
+                    df_failed = pd.DataFrame([mapping for mapping, _ in failed])
+                    df_failed["error"] = [
+                        str(e.orig).strip().replace("\n", " ") for _, e in failed
+                    ]
+                    df_failed.to_csv(
+                        failed_path,
+                        sep="\t",
+                        index=False,
+                        mode="a",
+                        header=not failed_path.exists(),
+                    )
+                    logging.warning(
+                        f"Failed to insert {len(failed)} rows into {table}, "
+                        f"see {failed_path}"
+                    )
+
+                self._write_checkpoint(tsv_name, n_read)
+                progress.update(n_new)
+
+        self._write_checkpoint(tsv_name, n_read, finished=True)
+
+        elapsed = time.perf_counter() - start
+        n_loaded = progress.n - progress.initial
+        log(
+            f"loaded {n_loaded} rows from {tsv_name} into {table} in {elapsed:.1f}s "
+            f"({n_loaded / elapsed:.0f} rows/s, {n_failed} failed)",
+            self.timestamp,
+        )
+
     def _populate_institutions(self):
+        if self.mode == "copy":
+            self._copy("institutions.tsv", Institution)
+        elif self.mode == "chunked":
+            self._load_chunked("institutions.tsv", Institution)
+        if self.mode != "orm":
+            log(
+                f"finished populating institutions table",
+                self.timestamp,
+            )
+            return
+
         df = pd.read_csv(
             self.MERGED_DATA_DIRECTORY / Path("institutions.tsv"),
             sep="\t",
@@ -59,6 +364,17 @@ class RDBMSLoader:
         )
 
     def _populate_authors(self):
+        if self.mode == "copy":
+            self._copy("authors.tsv", Author)
+        elif self.mode == "chunked":
+            self._load_chunked("authors.tsv", Author)
+        if self.mode != "orm":
+            log(
+                f"finished populating authors table",
+                self.timestamp,
+            )
+            return
+
         df = pd.read_csv(
             self.MERGED_DATA_DIRECTORY / Path("authors.tsv"),
             sep="\t",
@@ -74,6 +390,17 @@ class RDBMSLoader:
         )
 
     def _populate_documents(self):
+        if self.mode == "copy":
+            self._copy("documents.tsv", Document)
+        elif self.mode == "chunked":
+            self._load_chunked("documents.tsv", Document)
+        if self.mode != "orm":
+            log(
+                f"finished populating documents table",
+                self.timestamp,
+            )
+            return
+
         df = pd.read_csv(
             self.MERGED_DATA_DIRECTORY / Path("documents.tsv"),
             sep="\t",
@@ -88,9 +415,20 @@ class RDBMSLoader:
             self.timestamp,
         )
 
-    def _populate_authorships(self):
+    def _populate_authorships(self, tsv_name: str = "authorships.tsv"):
+        if self.mode == "copy":
+            self._copy(tsv_name, Authorship, distinct=True)
+        elif self.mode == "chunked":
+            self._load_chunked(tsv_name, Authorship, dtype={"institution_id": str})
+        if self.mode != "orm":
+            log(
+                f"finished populating authorships table",
+                self.timestamp,
+            )
+            return
+
         df = pd.read_csv(
-            self.MERGED_DATA_DIRECTORY / Path("authorships.tsv"),
+            self.MERGED_DATA_DIRECTORY / Path(tsv_name),
             sep="\t",
             dtype={"institution_id": str},
         )
@@ -105,11 +443,110 @@ class RDBMSLoader:
             self.timestamp,
         )
 
+    def _partition_authorships(self) -> list[str]:
+        """
+        Split the authorships into AUTHORSHIP_PARTITIONS files by the hash of
+        their document, so that duplicated rows always end up in the same file.
+        The split is deterministic, which keeps chunked load checkpoints valid
+        """
+        tsv_names = [f"authorships.part{i}.tsv" for i in range(AUTHORSHIP_PARTITIONS)]
+        tmp_paths = [
+            self.MERGED_DATA_DIRECTORY / f"{tsv_name}.tmp" for tsv_name in tsv_names
+        ]
+
+        tsv_path = self.MERGED_DATA_DIRECTORY / "authorships.tsv"
+        with open(tsv_path) as f:
+            header = f.readline()
+        for tmp_path in tmp_paths:
+            tmp_path.write_text(header)
+
+        reader = pd.read_csv(
+            tsv_path,
+            sep="\t",
+            dtype=str,
+            keep_default_na=False,
+            chunksize=1_000_000,
+        )
+        for chunk in reader:
+            partitions = (
+                pd.util.hash_pandas_object(chunk["document_id"], index=False)
+                % AUTHORSHIP_PARTITIONS
+            ).to_numpy()
+            for partition, tmp_path in enumerate(tmp_paths):
+                chunk[partitions == partition].to_csv(
+                    tmp_path,
+                    sep="\t",
+                    index=False,
+                    mode="a",
+                    header=False,
+                )
+
+        for tsv_name, tmp_path in zip(tsv_names, tmp_paths):
+            os.replace(tmp_path, self.MERGED_DATA_DIRECTORY / tsv_name)
+        return tsv_names
+
+    def _run_parallel(self, tasks: list) -> None:
+        # Every task opens its own session, so each worker gets its own
+        # connection from the engine's pool
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(task) for task in tasks]
+            for future in futures:
+                future.result()
+
     def load(self):
-        # Independent entities
-        self._populate_authors()
-        self._populate_documents()
-        self._populate_institutions()
+        start = time.perf_counter()
+
+        if self.mode == "chunked":
+            self.empty_tables = self._empty_tables()
+
+        if self.workers > 1:
+            self._run_parallel(
+                [
+                    self._populate_authors,
+                    self._populate_documents,
+                    self._populate_institutions,
+                ]
+            )
+            log(
+                f"loaded independent tables in {time.perf_counter() - start:.1f}s",
+                self.timestamp,
+            )
+
+            # Authorships can only be loaded after the rows they refer to
+            authorships_start = time.perf_counter()
+            self._run_parallel(
+                [
+                    lambda tsv_name=tsv_name: self._populate_authorships(tsv_name)
+                    for tsv_name in self._partition_authorships()
+                ]
+            )
+            log(
+                f"loaded authorships in {time.perf_counter() - authorships_start:.1f}s",
+                self.timestamp,
+            )
+        else:
+            # Independent entities
+            self._populate_authors()
+            self._populate_documents()
+            self._populate_institutions()
+
+            # Associative entity
+            self._populate_authorships()
 
-        # Associative entity
-        self._populate_authorships()
+        if not self.defer_constraints:
+            return
+
+        log(
+            f"loaded all tables in {time.perf_counter() - start:.1f}s",
+            self.timestamp,
+        )
+        timings = build_deferred_constraints(
+            workers=self.index_workers,
+            maintenance_work_mem=self.maintenance_work_mem,
+        )
+        log(
+            f"built indexes in {timings['indexes']:.1f}s, "
+            f"added foreign keys in {timings['foreign_keys']:.1f}s and "
+            f"validated them in {timings['validation']:.1f}s",
+            self.timestamp,
+        )
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from pathlib import Path
 
 from graphology.etl import (
@@ -7,6 +8,7 @@ from graphology.etl import (
     RDBMSLoader,
     GDBMSLoader,
 )
+from graphology.etl.extract.extractor import RAW_CACHE_MAX_AGE
 
 
 class Pipeline:
@@ -16,11 +18,19 @@ class Pipeline:
         start_year: int,
         end_year: int,
         data_directory: Path,
+        workers: int = 1,
+        rdbms_load_mode: str = "orm",
+        cache_max_age: timedelta | None = RAW_CACHE_MAX_AGE,
+        citation_matrix: bool = False,
     ) -> None:
         self.timestamp = timestamp
         self.start_year = start_year
         self.end_year = end_year
         self.data_directory = data_directory
+        self.workers = workers
+        self.rdbms_load_mode = rdbms_load_mode
+        self.cache_max_age = cache_max_age
+        self.citation_matrix = citation_matrix
 
     def run(self):
         # Extract the data
@@ -29,6 +39,7 @@ class Pipeline:
             start_year=self.start_year,
             end_year=self.end_year,
             data_directory=self.data_directory,
+            cache_max_age=self.cache_max_age,
         )
         extractor.extract()
 
@@ -38,6 +49,8 @@ class Pipeline:
             start_year=self.start_year,
             end_year=self.end_year,
             data_directory=self.data_directory,
+            workers=self.workers,
+            citation_matrix=self.citation_matrix,
         )
         rdbms_transformer.transform()
         rdbms_loader = RDBMSLoader(
@@ -45,6 +58,8 @@ class Pipeline:
             start_year=self.start_year,
             end_year=self.end_year,
             data_directory=self.data_directory,
+            mode=self.rdbms_load_mode,
+            workers=self.workers,
         )
         rdbms_loader.load()
 
@@ -54,6 +69,7 @@ class Pipeline:
             start_year=self.start_year,
             end_year=self.end_year,
             data_directory=self.data_directory,
+            workers=self.workers,
         )
         gdbms_transformer.transform()
         gdbms_loader = GDBMSLoader(
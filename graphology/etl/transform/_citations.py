@@ -0,0 +1,166 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Cumulative citations of every author by year, a row per author and a column
+# per year
+CITATIONS_FILE = "citations.npy"
+
+# Whether the author has any cited document in each year, which tells years
+# without publications apart from years without new citations
+PUBLICATIONS_FILE = "publications.npy"
+
+# Author of every row and year of every column of the matrices
+CITATION_AUTHORS_FILE = "citation_authors.tsv"
+CITATION_YEARS_FILE = "citation_years.tsv"
+
+CITATION_FILES = [
+    CITATIONS_FILE,
+    PUBLICATIONS_FILE,
+    CITATION_AUTHORS_FILE,
+    CITATION_YEARS_FILE,
+]
+
+
+def _read_chunks(path: Path, columns: list[str], chunk_size: int | None):
+    if chunk_size is None:
+        yield pd.read_csv(path, sep="\t", dtype=str, usecols=columns)
+    else:
+        yield from pd.read_csv(
+            path, sep="\t", dtype=str, usecols=columns, chunksize=chunk_size
+        )
+
+
+def _read_documents(
+    merged_directory: Path, chunk_size: int | None
+) -> tuple[pd.Index, np.ndarray, np.ndarray]:
+    # Year and citations of every dated and cited document
+    ids, years, citations = [], [], []
+    for df in _read_chunks(
+        merged_directory / "documents.tsv",
+        ["scopus_id", "date", "citedby_count"],
+        chunk_size,
+    ):
+        df = df[df["date"].notna() & df["citedby_count"].notna()]
+        year = pd.to_numeric(df["date"].str[:4], errors="coerce")
+        df, year = df[year.notna()], year[year.notna()]
+        ids.append(df["scopus_id"].to_numpy())
+        years.append(year.to_numpy(dtype=np.int64))
+        citations.append(
+            np.rint(
+                pd.to_numeric(df["citedby_count"], errors="coerce")
+                .fillna(0)
+                .to_numpy(dtype=np.float64)
+            ).astype(np.int64)
+        )
+    return (
+        pd.Index(np.concatenate(ids) if ids else [], dtype=object),
+        np.concatenate(years) if years else np.zeros(0, dtype=np.int64),
+        np.concatenate(citations) if citations else np.zeros(0, dtype=np.int64),
+    )
+
+
+def _read_authorships(
+    merged_directory: Path, documents: pd.Index, chunk_size: int | None
+):
+    # Author and document position of every authorship of a known document
+    for df in _read_chunks(
+        merged_directory / "authorships.tsv", ["document_id", "author_id"], chunk_size
+    ):
+        positions = documents.get_indexer(df["document_id"])
+        known = (positions >= 0) & df["author_id"].notna().to_numpy()
+        yield df["author_id"].to_numpy()[known], positions[known]
+
+
+def build_citation_matrix(
+    merged_directory: Path,
+    memory_budget: int | None = None,
+    chunk_size: int | None = None,
+) -> tuple[int, int]:
+    """
+    Write the author x year matrix of cumulative citations of the merged data.
+    Citations are counted once per authorship, like the notebook's query over
+    Author-Authorship-Document paths does, so an author with several
+    affiliations on a document counts its citations for each of them.
+
+    With `chunk_size`, the merged files are read `chunk_size` rows at a time,
+    in two passes over the authorships, so only the ids, years and citations
+    of documents and the ids of authors are held in memory. The matrices are
+    written through memory maps, and accumulated a block of authors at a time
+    so that a block fits in `memory_budget` bytes.
+
+    Returns the number of authors and years of the matrix
+    """
+    documents, document_years, document_citations = _read_documents(
+        merged_directory, chunk_size
+    )
+
+    # First pass, for the authors and years that make up the matrix
+    authors = []
+    first_year, last_year = None, None
+    for author_ids, positions in _read_authorships(
+        merged_directory, documents, chunk_size
+    ):
+        authors.append(pd.unique(author_ids))
+        if len(positions):
+            years = document_years[positions]
+            low, high = int(years.min()), int(years.max())
+            first_year = low if first_year is None else min(first_year, low)
+            last_year = high if last_year is None else max(last_year, high)
+    author_index = pd.Index(
+        np.sort(pd.unique(np.concatenate(authors))) if authors else [],
+        dtype=object,
+    )
+    del authors
+
+    n_authors = len(author_index)
+    if first_year is None or last_year is None:
+        first_year, n_years = 0, 0
+    else:
+        n_years = last_year - first_year + 1
+
+    shape = (n_authors, n_years)
+    cumulative = np.lib.format.open_memmap(
+        merged_directory / CITATIONS_FILE, mode="w+", dtype=np.int64, shape=shape
+    )
+    published = np.lib.format.open_memmap(
+        merged_directory / PUBLICATIONS_FILE, mode="w+", dtype=bool, shape=shape
+    )
+
+    # Second pass, adding up the yearly citations of every cell
+    yearly, cells_published = cumulative.reshape(-1), published.reshape(-1)
+    for author_ids, positions in _read_authorships(
+        merged_directory, documents, chunk_size
+    ):
+        cells = author_index.get_indexer(author_ids) * n_years + (
+            document_years[positions] - first_year
+        )
+        cells, inverse = np.unique(cells, return_inverse=True)
+        yearly[cells] += np.bincount(
+            inverse, weights=document_citations[positions], minlength=len(cells)
+        ).astype(np.int64)
+        cells_published[cells] = True
+    del documents, document_years, document_citations
+
+    block_size = max(1, n_authors)
+    if memory_budget is not None:
+        row_bytes = np.dtype(np.int64).itemsize * max(n_years, 1)
+        block_size = max(1, memory_budget // row_bytes)
+
+    for low in range(0, n_authors, block_size):
+        rows = cumulative[low : low + block_size]
+        np.cumsum(rows, axis=1, out=rows)
+
+    cumulative.flush()
+    published.flush()
+    del yearly, cells_published, cumulative, published
+
+    pd.DataFrame({"author_id": author_index}).to_csv(
+        merged_directory / CITATION_AUTHORS_FILE, sep="\t", index=False
+    )
+    pd.DataFrame({"year": np.arange(first_year, first_year + n_years)}).to_csv(
+        merged_directory / CITATION_YEARS_FILE, sep="\t", index=False
+    )
+
+    return n_authors, n_years
@@ -0,0 +1,203 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from graphology.etl._raw import read_raw
+
+TABLE_PREFIXES = ["documents", "institutions", "authors", "authorships"]
+
+# Columns of the documents table and the raw fields they are taken from
+DOCUMENT_FIELDS = {
+    "title": "title",
+    "scopus_id": "eid",
+    "doi": "doi",
+    "openaccess": "openaccess",
+    "date": "coverDate",
+    "document_type": "subtype",
+    "document_type_description": "subtypeDescription",
+    "volume": "volume",
+    "issue": "issueIdentifier",
+    "page": "pageRange",
+    "citedby_count": "citedby_count",
+    "funding_acronym": "fund_acr",
+    "funding_number": "fund_no",
+    "funding_name": "fund_sponsor",
+    "source_name": "publicationName",
+    "source_type": "aggregationType",
+    "source_id": "source_id",
+    "source_issn": "issn",
+    "source_eissn": "eIssn",
+}
+
+INSTITUTION_FIELDS = {
+    "scopus_id": "afid",
+    "name": "affilname",
+    "city": "affiliation_city",
+    "country": "affiliation_country",
+}
+
+AUTHOR_FIELDS = {
+    "scopus_id": "author_ids",
+    "name": "author_names",
+}
+
+
+def process_loop(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Build the tables of one year of search results, one result at a time
+    """
+    documents = []
+    authorships = []
+    authors = {}
+    institutions = {}
+
+    for result in df.itertuples(index=False):
+        document_id = result.eid
+        documents.append(
+            {
+                column: getattr(result, field)
+                for column, field in DOCUMENT_FIELDS.items()
+            }
+        )
+
+        if result.afid:
+            afids = result.afid.split(";")
+            names = result.affilname.split(";")
+            cities = result.affiliation_city.split(";")
+            countries = result.affiliation_country.split(";")
+            for i in range(len(afids)):
+                institutions[afids[i]] = {
+                    "scopus_id": afids[i],
+                    "name": names[i],
+                    "city": cities[i],
+                    "country": countries[i],
+                }
+
+        if result.author_ids:
+            ids = result.author_ids.split(";")
+            names = result.author_names.split(";")
+            afids = result.author_afids.split(";")
+            for i in range(len(ids)):
+                author_id = ids[i]
+                author_name = names[i]
+                authors[author_id] = {
+                    "scopus_id": author_id,
+                    "name": author_name,
+                }
+
+                authorships.append(
+                    {
+                        "document_id": document_id,
+                        "author_id": author_id,
+                        "institution_ids": ",".join(afids[i].split("-")),
+                        "first_author": i == 0,
+                    }
+                )
+
+    return {
+        "documents": pd.DataFrame(documents),
+        "institutions": pd.DataFrame(institutions.values()),
+        "authors": pd.DataFrame(authors.values()),
+        "authorships": pd.DataFrame(authorships),
+    }
+
+
+def _split_explode(df: pd.DataFrame, fields: list[str]) -> pd.DataFrame:
+    """
+    Split the ";"-joined fields of every row whose first field is not empty and
+    explode them side by side, using Arrow's string kernels. Exploded rows keep
+    the index of the row they came from
+    """
+    df = df[df[fields[0]].fillna("") != ""]
+
+    lists = [pc.split_pattern(pa.array(df[f], type=pa.string()), ";") for f in fields]
+    lengths = [pc.fill_null(pc.list_value_length(l), 0).to_numpy() for l in lists]
+    for field, field_lengths in zip(fields[1:], lengths[1:]):
+        if not np.array_equal(field_lengths, lengths[0]):
+            raise ValueError(f"{field} does not have as many entries as {fields[0]}")
+
+    parents = pc.list_parent_indices(lists[0]).to_numpy()
+    return pd.DataFrame(
+        {
+            field: pc.list_flatten(values).to_numpy(zero_copy_only=False)
+            for field, values in zip(fields, lists)
+        },
+        index=df.index[parents],
+    )
+
+
+def _keep_last_in_first_position(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    """
+    Deduplicate rows on `key` the way a dict filled row by row would: each key
+    keeps the position of its first occurrence and the values of its last
+    """
+    last = df.drop_duplicates(subset=key, keep="last").set_index(key)
+    order = df[key].drop_duplicates(keep="first")
+    return last.loc[order].reset_index()
+
+
+def process_vectorized(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Build the tables of one year of search results with column operations over
+    the whole year. The tables are the same as the ones built by `process_loop`
+    """
+    documents = df[list(DOCUMENT_FIELDS.values())].set_axis(
+        list(DOCUMENT_FIELDS), axis=1
+    )
+
+    institutions = _split_explode(df, list(INSTITUTION_FIELDS.values()))
+    institutions = institutions[list(INSTITUTION_FIELDS.values())].set_axis(
+        list(INSTITUTION_FIELDS), axis=1
+    )
+    institutions = _keep_last_in_first_position(institutions, "scopus_id")
+
+    exploded = _split_explode(df, ["author_ids", "author_names", "author_afids"])
+    document_ids = df["eid"].to_numpy()[df.index.get_indexer(exploded.index)]
+    first_author = np.ones(len(exploded), dtype=bool)
+    first_author[1:] = exploded.index[1:] != exploded.index[:-1]
+
+    authors = exploded[list(AUTHOR_FIELDS.values())].set_axis(
+        list(AUTHOR_FIELDS), axis=1
+    )
+    authors = _keep_last_in_first_position(authors, "scopus_id")
+
+    authorships = pd.DataFrame(
+        {
+            "document_id": document_ids,
+            "author_id": exploded["author_ids"].to_numpy(),
+            "institution_ids": pc.replace_substring(
+                pa.array(exploded["author_afids"], type=pa.string()), "-", ","
+            ).to_numpy(zero_copy_only=False),
+            # The first exploded row of each document is its first author
+            "first_author": first_author,
+        }
+    )
+
+    return {
+        "documents": documents.reset_index(drop=True),
+        "institutions": institutions,
+        "authors": authors,
+        "authorships": authorships,
+    }
+
+
+def process_year(
+    raw_path: Path,
+    processed_directory: Path,
+    year: int,
+    vectorized: bool = True,
+) -> None:
+    df = read_raw(raw_path)
+    tables = process_vectorized(df) if vectorized else process_loop(df)
+
+    for prefix in TABLE_PREFIXES:
+        # Files are replaced rather than rewritten in place, because they may
+        # be hard links to artifacts in the cache
+        path = processed_directory / f"{prefix}_{year}.tsv"
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        tables[prefix].to_csv(tmp_path, sep="\t", index=False)
+        os.replace(tmp_path, path)
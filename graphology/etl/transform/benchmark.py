@@ -0,0 +1,84 @@
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from graphology.etl._raw import RAW_FORMATS, read_raw
+from graphology.etl.transform._process import (
+    TABLE_PREFIXES,
+    process_loop,
+    process_vectorized,
+)
+from graphology import log
+
+
+def _best_time(f, df: pd.DataFrame, repeat: int) -> tuple[float, dict]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tables = f(df)
+        best = min(best, time.perf_counter() - start)
+    return best, tables  # type: ignore
+
+
+def benchmark_process(raw_directory: Path, repeat: int = 3) -> pd.DataFrame:
+    """
+    Time the per-row and the vectorized processing of every year of raw data in
+    `raw_directory`, checking that both produce the same tables
+    """
+    raw_paths = sorted(
+        path
+        for path in raw_directory.glob("results_*")
+        if path.suffix in RAW_FORMATS.values()
+    )
+
+    rows = []
+    for raw_path in raw_paths:
+        df = read_raw(raw_path)
+
+        loop_seconds, loop_tables = _best_time(process_loop, df, repeat)
+        vectorized_seconds, vectorized_tables = _best_time(
+            process_vectorized, df, repeat
+        )
+
+        for prefix in TABLE_PREFIXES:
+            # The per-row implementation builds tables without columns when
+            # there are no rows, so only non-empty tables are compared
+            if len(loop_tables[prefix]):
+                pd.testing.assert_frame_equal(
+                    loop_tables[prefix],
+                    vectorized_tables[prefix],
+                    check_dtype=False,
+                )
+
+        rows.append(
+            {
+                "file": raw_path.name,
+                "documents": len(df),
+                "authorships": len(vectorized_tables["authorships"]),
+                "loop_seconds": loop_seconds,
+                "vectorized_seconds": vectorized_seconds,
+                "speedup": loop_seconds / vectorized_seconds,
+            }
+        )
+        log(
+            f"{raw_path.name}: loop {loop_seconds:.3f}s, "
+            f"vectorized {vectorized_seconds:.3f}s "
+            f"({loop_seconds / vectorized_seconds:.1f}x)"
+        )
+
+    df_results = pd.DataFrame(rows)
+    if len(df_results):
+        total_loop = df_results["loop_seconds"].sum()
+        total_vectorized = df_results["vectorized_seconds"].sum()
+        log(
+            f"all years: loop {total_loop:.3f}s, vectorized {total_vectorized:.3f}s "
+            f"({total_loop / total_vectorized:.1f}x)"
+        )
+    return df_results
+
+
+if __name__ == "__main__":
+    # Usage: python -m graphology.etl.transform.benchmark data/<run>/raw
+    print(benchmark_process(Path(sys.argv[1])))
@@ -1,24 +1,102 @@
-import pickle
 import logging
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from sqlalchemy import text
 from sqlmodel import Session
 
+from graphology.etl._constants import FREQUENT_COLLABORATION_THRESHOLD
+from graphology.etl._cache import (
+    CACHE_VERSION,
+    ArtifactCache,
+    file_digest,
+    key_digest,
+    read_fingerprint,
+    write_fingerprint,
+)
 from graphology.etl._helpers import (
-    is_empty,
+    Neo4jImportWriter,
+    iter_neo4j_import,
     merged_data_directory,
     neo4j_data_directory,
+    neo4j_import_files,
     processed_data_directory,
     raw_data_directory_path,
+    read_neo4j_import,
 )
+from graphology.etl._raw import find_raw_file
+from graphology.etl.transform._citations import CITATION_FILES, build_citation_matrix
+from graphology.etl.transform._process import TABLE_PREFIXES, process_year
 
 from graphology.etl.load.rdbms.database import engine
 
 from graphology import log
 
+# - stepwise: every step reads its input from and writes its output to disk
+# - fused: every table is read once, kept in memory and written once
+# - chunked: every table is streamed in chunks that fit a memory budget
+MERGE_STRATEGIES = ["stepwise", "fused", "chunked"]
+
+# Bump this whenever the contents of the neo4j import files change
+NEO4J_IMPORT_VERSION = 4
+
+# Files written for neo4j-admin import, without their extension
+NEO4J_IMPORT_FILES = [
+    "node_authors",
+    "node_documents",
+    "node_institutions",
+    "node_authorships",
+    "rel_authorship_author",
+    "rel_authorship_document",
+    "rel_authorship_institution",
+    "rel_author_author",
+    "rel_author_author_frequent",
+]
+
+
+class _HashedKeySet:
+    """
+    Set of 64-bit row hashes, used to deduplicate a table that is streamed in
+    chunks. It takes 8 bytes per distinct row
+    """
+
+    def __init__(self) -> None:
+        # Disjoint sorted blocks of decreasing size. A block is merged into the
+        # one before it once it grows to half its size, so every hash is merged
+        # a logarithmic number of times and lookups search few blocks
+        self.blocks: list[np.ndarray] = []
+
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        # Sorted lookups walk every block in order, which is much faster
+        order = np.argsort(hashes)
+        sorted_hashes = hashes[order]
+        seen = np.zeros(len(hashes), dtype=bool)
+        for block in self.blocks:
+            positions = np.searchsorted(block, sorted_hashes)
+            positions = np.minimum(positions, len(block) - 1)
+            seen[order] |= block[positions] == sorted_hashes
+        return seen
+
+    def add(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Add `hashes` to the set, returning a mask of the ones that had not been
+        seen before, neither in earlier chunks nor earlier in this one
+        """
+        is_new = ~pd.Series(hashes).duplicated().to_numpy() & ~self._contains(hashes)
+
+        block = np.sort(hashes[is_new])
+        while self.blocks and len(self.blocks[-1]) <= 2 * len(block):
+            block = np.sort(np.concatenate([self.blocks.pop(), block]))
+        if len(block):
+            self.blocks.append(block)
+        return is_new
+
 
 class Transformer:
     def __init__(
@@ -27,10 +105,26 @@ class Transformer:
         start_year: int,
         end_year: int,
         data_directory: Path,
+        vectorized: bool = True,
+        workers: int = 1,
+        merge_strategy: str = "stepwise",
+        memory_budget: int = 512 * 1024**2,
+        citation_matrix: bool = False,
     ) -> None:
         self.timestamp: str = timestamp
         self.start_year: int = start_year
         self.end_year: int = end_year
+        self.vectorized: bool = vectorized
+        self.workers: int = workers
+        if merge_strategy not in MERGE_STRATEGIES:
+            raise ValueError(
+                f"Unknown merge strategy {merge_strategy!r}, "
+                f"expected one of {MERGE_STRATEGIES}"
+            )
+        self.merge_strategy: str = merge_strategy
+        self.memory_budget: int = memory_budget
+        self.citation_matrix: bool = citation_matrix
+        self.cache = ArtifactCache(data_directory)
 
         self.RAW_DATA_DIRECTORY: Path = raw_data_directory_path(
             self.timestamp, start_year, end_year, data_directory
@@ -46,134 +140,121 @@ class Transformer:
         )
         self.MERGED_DATA_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
-    def process(self) -> None:
+    def process(self) -> dict[int, str]:
+        """
+        Process every year that has raw data, reusing the processed files of
+        any earlier run whose raw data had the same contents. Returns the cache
+        key of the processed files of each year
+        """
+        raw_paths = {}
         for year in range(self.end_year, self.start_year - 1, -1):
-            pickle_path = self.RAW_DATA_DIRECTORY / f"results_{year}.pkl"
-            if not pickle_path.exists():
+            raw_path = find_raw_file(self.RAW_DATA_DIRECTORY, year)
+            if raw_path is not None:
+                raw_paths[year] = raw_path
+
+        keys: dict[int, str] = {}
+        pending_years = []
+        for year, raw_path in raw_paths.items():
+            keys[year] = key_digest(
+                "processed",
+                CACHE_VERSION,
+                year,
+                self.vectorized,
+                file_digest(raw_path),
+            )
+            entry = self.cache.get("processed", keys[year])
+            if entry is None:
+                pending_years.append(year)
                 continue
 
-            with open(pickle_path, "rb") as f:
-                results = pickle.load(f)
-
-            documents = []
-            authorships = []
-            authors = {}
-            institutions = {}
-
-            for result in results:
-                document_id = result.eid
-                documents.append(
-                    {
-                        "title": result.title,
-                        "scopus_id": document_id,
-                        "doi": result.doi,
-                        "openaccess": result.openaccess,
-                        "date": result.coverDate,
-                        "document_type": result.subtype,
-                        "document_type_description": result.subtypeDescription,
-                        "volume": result.volume,
-                        "issue": result.issueIdentifier,
-                        "page": result.pageRange,
-                        "citedby_count": result.citedby_count,
-                        "funding_acronym": result.fund_acr,
-                        "funding_number": result.fund_no,
-                        "funding_name": result.fund_sponsor,
-                        "source_name": result.publicationName,
-                        "source_type": result.aggregationType,
-                        "source_id": result.source_id,
-                        "source_issn": result.issn,
-                        "source_eissn": result.eIssn,
-                    }
-                )
-
-                if result.afid:
-                    afids = result.afid.split(";")
-                    names = result.affilname.split(";")
-                    cities = result.affiliation_city.split(";")
-                    countries = result.affiliation_country.split(";")
-                    for i in range(len(afids)):
-                        institutions[afids[i]] = {
-                            "scopus_id": afids[i],
-                            "name": names[i],
-                            "city": cities[i],
-                            "country": countries[i],
-                        }
-
-                if result.author_ids:
-                    ids = result.author_ids.split(";")
-                    names = result.author_names.split(";")
-                    afids = result.author_afids.split(";")
-                    for i in range(len(ids)):
-                        author_id = ids[i]
-                        author_name = names[i]
-                        authors[author_id] = {
-                            "scopus_id": author_id,
-                            "name": author_name,
-                        }
-
-                        authorships.append(
-                            {
-                                "document_id": document_id,
-                                "author_id": author_id,
-                                "institution_ids": ",".join(afids[i].split("-")),
-                                "first_author": i == 0,
-                            }
-                        )
-
-            pd.DataFrame(documents).to_csv(
-                self.PROCESSED_DATA_DIRECTORY / f"documents_{year}.tsv",
-                sep="\t",
-                index=False,
+            self.cache.materialize(entry, self.PROCESSED_DATA_DIRECTORY)
+            log(
+                f"reused cached processed data from {year}",
+                self.timestamp,
             )
 
-            pd.DataFrame(authors.values()).to_csv(
-                self.PROCESSED_DATA_DIRECTORY / f"authors_{year}.tsv",
-                sep="\t",
-                index=False,
-            )
+        # Every year is independent, so they are fanned out over a process pool,
+        # unless there is a single worker, which runs them inline instead of
+        # paying for a pool. Results are collected in year order to keep the
+        # logs deterministic
+        failed_years: dict[int, Exception] = {}
+        with ExitStack() as stack:
+            tasks = {
+                year: partial(
+                    process_year,
+                    raw_paths[year],
+                    self.PROCESSED_DATA_DIRECTORY,
+                    year,
+                    self.vectorized,
+                )
+                for year in pending_years
+            }
+            if self.workers > 1 and len(tasks) > 1:
+                executor = stack.enter_context(
+                    ProcessPoolExecutor(max_workers=self.workers)
+                )
+                tasks = {
+                    year: executor.submit(task).result for year, task in tasks.items()
+                }
 
-            pd.DataFrame(institutions.values()).to_csv(
-                self.PROCESSED_DATA_DIRECTORY / f"institutions_{year}.tsv",
-                sep="\t",
-                index=False,
-            )
+            for year, task in tasks.items():
+                try:
+                    task()
+                except Exception as e:
+                    failed_years[year] = e
+                    log(
+                        f"failed to process data from {year}: {e!r}",
+                        self.timestamp,
+                        logging.ERROR,
+                    )
+                    continue
+
+                self.cache.put(
+                    "processed",
+                    keys[year],
+                    [
+                        self.PROCESSED_DATA_DIRECTORY / f"{prefix}_{year}.tsv"
+                        for prefix in TABLE_PREFIXES
+                    ],
+                    {"year": year, "raw": raw_paths[year].name},
+                )
+                log(
+                    f"finished processing data from {year}",
+                    self.timestamp,
+                )
 
-            pd.DataFrame(authorships).to_csv(
-                self.PROCESSED_DATA_DIRECTORY / f"authorships_{year}.tsv",
-                sep="\t",
-                index=False,
-            )
+        if failed_years:
+            raise Exception(f"Unable to process data from {sorted(failed_years)}")
 
-    def merge(self):
-        TABLE_PREFIXES = ["documents", "institutions", "authors", "authorships"]
+        return keys
 
-        for prefix in TABLE_PREFIXES:
-            # Find all matching authorship files
-            tsv_files = sorted(self.PROCESSED_DATA_DIRECTORY.glob(f"{prefix}_*.tsv"))
+    def _read_merged(self, prefix: str) -> pd.DataFrame:
+        return pd.read_csv(
+            self.MERGED_DATA_DIRECTORY / f"{prefix}.tsv",
+            sep="\t",
+            dtype=str,
+        )
 
-            # Load and concatenate all files
-            df = pd.concat(
-                (pd.read_csv(f, sep="\t", dtype=str) for f in tsv_files),
-                ignore_index=True,
-            )
+    def _write_merged(self, prefix: str, df: pd.DataFrame) -> None:
+        df.to_csv(
+            self.MERGED_DATA_DIRECTORY / f"{prefix}.tsv",
+            sep="\t",
+            index=False,
+        )
 
-            # Save to a single merged file
-            df.to_csv(
-                self.MERGED_DATA_DIRECTORY / f"{prefix}.tsv",
-                sep="\t",
-                index=False,
-            )
+    def _concat_processed(self, prefix: str) -> pd.DataFrame:
+        # Find all matching authorship files
+        tsv_files = sorted(self.PROCESSED_DATA_DIRECTORY.glob(f"{prefix}_*.tsv"))
 
-    def normalize(self):
-        """
-        Normalize the data in authorships.tsv by splitting the "institution_ids" row
-        """
-        # fmt: off
-        df_authorships = pd.read_csv(
-            self.MERGED_DATA_DIRECTORY / "authorships.tsv",
-            sep="\t",
-            dtype=str,
+        # Load and concatenate all files
+        return pd.concat(
+            (pd.read_csv(f, sep="\t", dtype=str) for f in tsv_files),
+            ignore_index=True,
         )
+
+    @staticmethod
+    def _normalize_authorships(df_authorships: pd.DataFrame) -> pd.DataFrame:
+        # fmt: off
         df_authorships["institution_ids"] = df_authorships["institution_ids"].str.split(",")
         df_authorships = df_authorships.explode("institution_ids").reset_index(drop=True)
         df_authorships = df_authorships.rename(
@@ -181,36 +262,13 @@ class Transformer:
                 "institution_ids": "institution_id",
             }
         )
-        df_authorships.to_csv(
-            self.MERGED_DATA_DIRECTORY / "authorships.tsv",
-            sep="\t",
-            index=False,
-        )
+        # Empty ids become missing values, as they would after a round trip
+        # through a TSV file
+        df_authorships["institution_id"] = df_authorships["institution_id"].replace("", np.nan)
         # fmt: on
+        return df_authorships
 
-    def remove_invalid_authorships(self):
-        """
-        Remove authorship.tsv entries from institutions not in institutions.tsv
-        """
-        df_authorships = pd.read_csv(
-            self.MERGED_DATA_DIRECTORY / "authorships.tsv",
-            sep="\t",
-            dtype=str,
-        )
-        df_institutions = pd.read_csv(
-            self.MERGED_DATA_DIRECTORY / "institutions.tsv",
-            sep="\t",
-            dtype=str,
-        )
-
-        valid_institutions = df_institutions["scopus_id"].unique().tolist()
-        df_filtered_authorships = df_authorships[
-            df_authorships["institution_id"].isnull()
-            | df_authorships["institution_id"].isin(valid_institutions)
-        ]
-
-        n_authorships = len(df_authorships)
-        n_filtered_authorships = len(df_filtered_authorships)
+    def _log_cleaning(self, n_authorships: int, n_filtered_authorships: int) -> None:
         removed_authorships_percentage = round(
             (n_authorships - n_filtered_authorships) / n_authorships * 100,
             5,  # Round to five decimal places
@@ -228,56 +286,204 @@ class Transformer:
             self.timestamp,
         )
 
-        df_filtered_authorships.to_csv(
-            self.MERGED_DATA_DIRECTORY / "authorships.tsv",
-            sep="\t",
-            index=False,
+    def _filter_invalid_authorships(
+        self,
+        df_authorships: pd.DataFrame,
+        df_institutions: pd.DataFrame,
+    ) -> pd.DataFrame:
+        valid_institutions = df_institutions["scopus_id"].unique().tolist()
+        df_filtered_authorships = df_authorships[
+            df_authorships["institution_id"].isnull()
+            | df_authorships["institution_id"].isin(valid_institutions)
+        ]
+
+        self._log_cleaning(len(df_authorships), len(df_filtered_authorships))
+
+        return df_filtered_authorships
+
+    @staticmethod
+    def _deduplicate(prefix: str, df: pd.DataFrame) -> pd.DataFrame:
+        if prefix == "authorships":
+            return df.drop_duplicates()
+        return df.drop_duplicates(subset="scopus_id", keep="first")
+
+    def merge(self):
+        for prefix in TABLE_PREFIXES:
+            # Save to a single merged file
+            self._write_merged(prefix, self._concat_processed(prefix))
+
+    def normalize(self):
+        """
+        Normalize the data in authorships.tsv by splitting the "institution_ids" row
+        """
+        df_authorships = self._read_merged("authorships")
+        self._write_merged("authorships", self._normalize_authorships(df_authorships))
+
+    def remove_invalid_authorships(self):
+        """
+        Remove authorship.tsv entries from institutions not in institutions.tsv
+        """
+        df_filtered_authorships = self._filter_invalid_authorships(
+            self._read_merged("authorships"),
+            self._read_merged("institutions"),
         )
+        self._write_merged("authorships", df_filtered_authorships)
 
     def drop_duplicates(self):
-        TABLE_PREFIXES = ["documents", "institutions", "authors", "authorships"]
+        for prefix in TABLE_PREFIXES:
+            df = self._read_merged(prefix)
+            self._write_merged(prefix, self._deduplicate(prefix, df))
+
+    def merge_fused(self):
+        """
+        Merge, normalize, clean and deduplicate the processed tables in memory,
+        reading every processed file and writing every merged file only once
+        """
+        tables = {prefix: self._concat_processed(prefix) for prefix in TABLE_PREFIXES}
+
+        df_authorships = self._normalize_authorships(tables["authorships"])
+        tables["authorships"] = self._filter_invalid_authorships(
+            df_authorships,
+            tables["institutions"],
+        )
 
         for prefix in TABLE_PREFIXES:
-            df = pd.read_csv(
-                self.MERGED_DATA_DIRECTORY / f"{prefix}.tsv",
-                sep="\t",
-                dtype=str,
-            )
+            self._write_merged(prefix, self._deduplicate(prefix, tables[prefix]))
 
-            if prefix == "authorships":
-                df = df.drop_duplicates()
-            else:
-                df = df.drop_duplicates(subset="scopus_id", keep="first")
+    def _chunk_size(self, tsv_file: Path) -> int:
+        """
+        Number of rows per chunk that keeps a chunk and its intermediate copies
+        within the memory budget, estimated from a sample of the file
+        """
+        sample = pd.read_csv(tsv_file, sep="\t", dtype=str, nrows=1000)
+        row_bytes = sample.memory_usage(index=False, deep=True).sum() / max(
+            len(sample), 1
+        )
 
-            df.to_csv(
-                self.MERGED_DATA_DIRECTORY / f"{prefix}.tsv",
-                sep="\t",
-                index=False,
-            )
+        # Normalizing, filtering and hashing a chunk make a few copies of it
+        COPIES = 4
+        return max(1000, int(self.memory_budget // (COPIES * max(row_bytes, 1))))
+
+    def merge_chunked(self):
+        """
+        Merge, normalize, clean and deduplicate the processed tables in bounded
+        memory, streaming every processed file in chunks. Rows already written
+        are recognized by their hash (of the scopus_id, or of the whole row for
+        authorships), so the output is the same as the in-memory strategies'
+        """
+        valid_institutions: set[str] = set()
+
+        # Institutions are merged before authorships, which are cleaned with them
+        for prefix in TABLE_PREFIXES:
+            tsv_files = sorted(self.PROCESSED_DATA_DIRECTORY.glob(f"{prefix}_*.tsv"))
+            if not tsv_files:
+                log(
+                    f"Skipped merging {prefix}, because there is no processed data.",
+                    self.timestamp,
+                    logging.WARNING,
+                )
+                continue
+
+            chunk_size = self._chunk_size(tsv_files[0])
+            keys = _HashedKeySet()
+
+            def prepare(df: pd.DataFrame) -> pd.DataFrame:
+                if prefix == "authorships":
+                    return self._normalize_authorships(df)
+                return df
+
+            # Write the header first, so the file exists even if it has no rows
+            header = prepare(pd.read_csv(tsv_files[0], sep="\t", dtype=str, nrows=0))
+            self._write_merged(prefix, header)
+
+            n_authorships = n_filtered_authorships = 0
+            for tsv_file in tsv_files:
+                for chunk in pd.read_csv(
+                    tsv_file, sep="\t", dtype=str, chunksize=chunk_size
+                ):
+                    chunk = prepare(chunk)
+
+                    if prefix == "institutions":
+                        valid_institutions.update(chunk["scopus_id"].dropna())
+
+                    if prefix == "authorships":
+                        n_authorships += len(chunk)
+                        chunk = chunk[
+                            chunk["institution_id"].isnull()
+                            | chunk["institution_id"].isin(valid_institutions)
+                        ]
+                        n_filtered_authorships += len(chunk)
+                        hashes = pd.util.hash_pandas_object(chunk, index=False)
+                    else:
+                        hashes = pd.util.hash_pandas_object(
+                            chunk["scopus_id"], index=False
+                        )
+
+                    chunk = chunk[keys.add(hashes.to_numpy())]
+                    chunk.to_csv(
+                        self.MERGED_DATA_DIRECTORY / f"{prefix}.tsv",
+                        sep="\t",
+                        index=False,
+                        header=False,
+                        mode="a",
+                    )
+
+            if prefix == "authorships":
+                self._log_cleaning(n_authorships, n_filtered_authorships)
 
-    def transform(self):
-        # Do nothing if data has already been processed
-        if not is_empty(self.PROCESSED_DATA_DIRECTORY):
             log(
-                "Skipped data processing, because data has already been processed.",
+                f"finished merging {prefix} in chunks of {chunk_size} rows",
                 self.timestamp,
             )
-            return
 
-        self.process()
+    def build_citation_matrix(self):
+        n_authors, n_years = build_citation_matrix(
+            self.MERGED_DATA_DIRECTORY,
+            self.memory_budget,
+            self._chunk_size(self.MERGED_DATA_DIRECTORY / "authorships.tsv"),
+        )
+        log(
+            f"finished building the citation matrix of {n_authors} authors "
+            f"over {n_years} years",
+            self.timestamp,
+        )
+
+    def transform(self):
+        processed_keys = self.process()
 
-        # Do nothing more if data has already been merged
-        if not is_empty(self.MERGED_DATA_DIRECTORY):
+        # Do nothing more if the merged data was built from the same processed
+        # data. Which merge strategy built it does not matter, they all produce
+        # the same files
+        fingerprint = key_digest("merged", CACHE_VERSION, processed_keys)
+        if read_fingerprint(self.MERGED_DATA_DIRECTORY) == fingerprint:
             log(
                 "Skipped data merging, because data has already been merged.",
                 self.timestamp,
             )
+            # Merged data built without the citation matrix lacks it
+            if self.citation_matrix and not all(
+                (self.MERGED_DATA_DIRECTORY / name).exists() for name in CITATION_FILES
+            ):
+                self.build_citation_matrix()
             return
 
-        self.merge()
-        self.normalize()
-        self.remove_invalid_authorships()
-        self.drop_duplicates()
+        # Mark the merged data as out of date until it has been fully rebuilt
+        write_fingerprint(self.MERGED_DATA_DIRECTORY, None)
+
+        if self.merge_strategy == "fused":
+            self.merge_fused()
+        elif self.merge_strategy == "chunked":
+            self.merge_chunked()
+        else:
+            self.merge()
+            self.normalize()
+            self.remove_invalid_authorships()
+            self.drop_duplicates()
+
+        if self.citation_matrix:
+            self.build_citation_matrix()
+
+        write_fingerprint(self.MERGED_DATA_DIRECTORY, fingerprint)
 
 
 class RDBMSTransformer(Transformer):
@@ -291,14 +497,48 @@ class GDBMSTransformer(Transformer):
         start_year: int,
         end_year: int,
         data_directory: Path,
+        author_edges: str = "sparse",
+        authorship_ids: str = "uuid",
+        neo4j_format: str = "tsv",
+        neo4j_part_rows: int = 1_000_000,
+        **kwargs,
     ) -> None:
-        super().__init__(timestamp, start_year, end_year, data_directory)
+        super().__init__(timestamp, start_year, end_year, data_directory, **kwargs)
+
+        # - sparse: co-authorships are computed in-process from authorships.tsv
+        # - rdbms: co-authorships are queried from the loaded Postgres database
+        if author_edges not in ["sparse", "rdbms"]:
+            raise ValueError(f"Unknown author edges source {author_edges!r}")
+        self.author_edges: str = author_edges
+
+        # - uuid: authorship nodes get random ids, different on every run
+        # - integer: authorship nodes are numbered in a fixed order, which gives
+        #   shorter ids that are the same on every run over the same data
+        if authorship_ids not in ["uuid", "integer"]:
+            raise ValueError(f"Unknown authorship id type {authorship_ids!r}")
+        self.authorship_ids: str = authorship_ids
+
+        # - tsv: one plain file per node or relationship type
+        # - gzip: one header file and gzip-compressed parts of at most
+        #   `neo4j_part_rows` rows each, which neo4j-admin reads in parallel
+        if neo4j_format not in ["tsv", "gzip"]:
+            raise ValueError(f"Unknown neo4j import format {neo4j_format!r}")
+        self.neo4j_format: str = neo4j_format
+        self.neo4j_part_rows: int = neo4j_part_rows
 
         self.NEO4J_DATA_DIRECTORY: Path = neo4j_data_directory(
             self.timestamp, start_year, end_year, data_directory
         )
         self.NEO4J_DATA_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
+    def _neo4j_import_writer(self, name: str, columns) -> Neo4jImportWriter:
+        part_rows = self.neo4j_part_rows if self.neo4j_format == "gzip" else None
+        return Neo4jImportWriter(self.NEO4J_DATA_DIRECTORY, name, columns, part_rows)
+
+    def _write_neo4j_import(self, name: str, df: pd.DataFrame):
+        with self._neo4j_import_writer(name, df.columns) as writer:
+            writer.write(df)
+
     def format_neo4j_import(self):
         # Load cleaned authorships
         df_authorships = pd.read_csv(
@@ -307,10 +547,20 @@ class GDBMSTransformer(Transformer):
             dtype=str,
         )
 
-        # Generate UUIDs for authorship nodes
-        df_authorships["id:ID(Authorship)"] = [
-            str(uuid.uuid4()) for _ in range(len(df_authorships))
-        ]
+        if self.authorship_ids == "integer":
+            # The ids are imported as strings, like those of the other nodes,
+            # because neo4j-admin only takes one id type for all of them
+            df_authorships = df_authorships.sort_values(
+                ["document_id", "author_id", "institution_id", "first_author"],
+                kind="stable",
+                na_position="first",
+            ).reset_index(drop=True)
+            df_authorships["id:ID(Authorship)"] = np.arange(len(df_authorships))
+        else:
+            # Generate UUIDs for authorship nodes
+            df_authorships["id:ID(Authorship)"] = [
+                str(uuid.uuid4()) for _ in range(len(df_authorships))
+            ]
 
         # Save authorship nodes
         df_authorship_nodes = df_authorships[
@@ -322,11 +572,7 @@ class GDBMSTransformer(Transformer):
                 "first_author",
             ]
         ]
-        df_authorship_nodes.to_csv(
-            self.NEO4J_DATA_DIRECTORY / "node_authorships.tsv",
-            sep="\t",
-            index=False,
-        )
+        self._write_neo4j_import("node_authorships", df_authorship_nodes)
 
         # Load cleaned authors
         nodes = ["authors", "documents", "institutions"]
@@ -343,11 +589,7 @@ class GDBMSTransformer(Transformer):
                 }
             )
 
-            df.to_csv(
-                self.NEO4J_DATA_DIRECTORY / f"node_{node}.tsv",
-                sep="\t",
-                index=False,
-            )
+            self._write_neo4j_import(f"node_{node}", df)
 
         # Create relationship files
         def rel_df(start_col, end_col):
@@ -360,20 +602,10 @@ class GDBMSTransformer(Transformer):
             df = df[df[f":END_ID({end_col})"].notna()]
             return df
 
-        rel_df("id", "Author").to_csv(
-            self.NEO4J_DATA_DIRECTORY / "rel_authorship_author.tsv",
-            sep="\t",
-            index=False,
-        )
-        rel_df("id", "Document").to_csv(
-            self.NEO4J_DATA_DIRECTORY / "rel_authorship_document.tsv",
-            sep="\t",
-            index=False,
-        )
-        rel_df("id", "Institution").to_csv(
-            self.NEO4J_DATA_DIRECTORY / "rel_authorship_institution.tsv",
-            sep="\t",
-            index=False,
+        self._write_neo4j_import("rel_authorship_author", rel_df("id", "Author"))
+        self._write_neo4j_import("rel_authorship_document", rel_df("id", "Document"))
+        self._write_neo4j_import(
+            "rel_authorship_institution", rel_df("id", "Institution")
         )
 
     def add_neo4j_author_edges(self):
@@ -407,22 +639,154 @@ class GDBMSTransformer(Transformer):
                 "count:int",
             ],  # type: ignore
         )
-        df.to_csv(
-            self.NEO4J_DATA_DIRECTORY / "rel_author_author.tsv",
+        self._write_neo4j_import("rel_author_author", df)
+
+    def build_neo4j_author_edges(self, pair_budget: int = 20_000_000):
+        """
+        Compute the same co-authorship counts as `add_neo4j_author_edges`
+        without a database. Authorships form a sparse document x author
+        incidence matrix A, and A.T @ A counts the documents shared by every
+        pair of authors. The product is computed in blocks of authors of about
+        `pair_budget` pairs, which are written out as soon as they are ready
+        """
+        df = pd.read_csv(
+            self.MERGED_DATA_DIRECTORY / "authorships.tsv",
             sep="\t",
-            index=False,
+            dtype=str,
+            usecols=["document_id", "author_id"],
+        ).drop_duplicates()
+
+        # Authors are numbered in id order, so that a1 < a2 compares ids
+        document_codes, document_ids = pd.factorize(df["document_id"])
+        author_codes, author_ids = pd.factorize(df["author_id"], sort=True)
+        n_documents, n_authors = len(document_ids), len(author_ids)
+        del df
+
+        incidence = sparse.csr_matrix(
+            (
+                np.ones(len(author_codes), dtype=np.int32),
+                (document_codes, author_codes),
+            ),
+            shape=(n_documents, n_authors),
+        )
+        incidence_t = incidence.T.tocsr()
+
+        # Split authors in blocks of about the same number of candidate pairs
+        authors_per_document = np.asarray(incidence.sum(axis=1)).ravel()
+        pairs_per_author = incidence_t @ authors_per_document
+        block_ends = np.searchsorted(
+            np.cumsum(pairs_per_author),
+            np.arange(pair_budget, pairs_per_author.sum() + pair_budget, pair_budget),
+            side="right",
+        )
+        block_ends = np.unique(np.clip(block_ends, 1, n_authors))
+
+        columns = [":START_ID(Author)", ":END_ID(Author)", "count:int"]
+
+        n_pairs = 0
+        start = 0
+        with self._neo4j_import_writer("rel_author_author", columns) as writer:
+            for end in block_ends:
+                block = incidence_t[start:end] @ incidence
+
+                # Only keep pairs whose second author comes after the first
+                block = sparse.triu(block, k=start + 1).tocsr()
+                block.sort_indices()
+                block = block.tocoo()
+
+                writer.write(
+                    pd.DataFrame(
+                        {
+                            columns[0]: author_ids[block.row + start],
+                            columns[1]: author_ids[block.col],
+                            columns[2]: block.data,
+                        }
+                    )
+                )
+
+                n_pairs += block.nnz
+                start = end
+
+        log(
+            f"finished computing {n_pairs} co-authorships of {n_authors} authors",
+            self.timestamp,
+        )
+
+    def write_frequent_collaborations(self):
+        """
+        Write the co-authorships of at least FREQUENT_COLLABORATION_THRESHOLD
+        documents as a relationship type of their own, and label the authors
+        that have any, so that community detection can project them natively
+        instead of filtering every co-authorship with Cypher
+        """
+        reader = iter_neo4j_import(
+            self.NEO4J_DATA_DIRECTORY, "rel_author_author", 1_000_000, dtype=str
+        )
+        columns = [":START_ID(Author)", ":END_ID(Author)", "count:int"]
+
+        frequent_authors = set()
+        with self._neo4j_import_writer("rel_author_author_frequent", columns) as writer:
+            for chunk in reader:
+                chunk = chunk[
+                    chunk["count:int"].astype(int) >= FREQUENT_COLLABORATION_THRESHOLD
+                ]
+                writer.write(chunk)
+                frequent_authors.update(chunk[":START_ID(Author)"])
+                frequent_authors.update(chunk[":END_ID(Author)"])
+
+        df_authors = read_neo4j_import(
+            self.NEO4J_DATA_DIRECTORY, "node_authors", dtype=str, keep_default_na=False
+        )
+        df_authors[":LABEL"] = np.where(
+            df_authors["scopus_id:ID(Author)"].isin(frequent_authors),
+            "FrequentCollaborator",
+            "",
+        )
+        self._write_neo4j_import("node_authors", df_authors)
+
+        log(
+            f"found {len(frequent_authors)} authors with frequent collaborations",
+            self.timestamp,
+        )
+
+    def _clear_neo4j_import(self):
+        for name in NEO4J_IMPORT_FILES:
+            for path in neo4j_import_files(self.NEO4J_DATA_DIRECTORY, name):
+                path.unlink(missing_ok=True)
+
+    def _neo4j_fingerprint(self) -> str:
+        return key_digest(
+            "neo4j",
+            CACHE_VERSION,
+            NEO4J_IMPORT_VERSION,
+            read_fingerprint(self.MERGED_DATA_DIRECTORY),
+            self.author_edges,
+            self.authorship_ids,
+            self.neo4j_format,
+            self.neo4j_part_rows if self.neo4j_format == "gzip" else None,
         )
 
     def transform(self):
         super().transform()
 
-        # Do nothing if data has already been formatted for neo4j import
-        if not is_empty(self.NEO4J_DATA_DIRECTORY):
+        # Do nothing if data has already been formatted for neo4j import from
+        # the same merged data
+        fingerprint = self._neo4j_fingerprint()
+        if read_fingerprint(self.NEO4J_DATA_DIRECTORY) == fingerprint:
             log(
                 "Skipped data formatting for neo4j, because that has already been done.",
                 self.timestamp,
             )
             return
 
+        write_fingerprint(self.NEO4J_DATA_DIRECTORY, None)
+        self._clear_neo4j_import()
+
         self.format_neo4j_import()
-        self.add_neo4j_author_edges()
+        if self.author_edges == "rdbms":
+            self.add_neo4j_author_edges()
+        else:
+            self.build_neo4j_author_edges()
+        self.write_frequent_collaborations()
+
+        write_fingerprint(self.NEO4J_DATA_DIRECTORY, fingerprint)